@@ -15,19 +15,33 @@ Features:
 
 from fastapi import FastAPI, HTTPException, Depends, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any, Set, Union
-from datetime import datetime, timedelta
+from fastapi.responses import ORJSONResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.types import ASGIApp, Receive, Scope, Send
+from pydantic import BaseModel, Field, PrivateAttr, SerializationInfo, model_serializer
+from typing import Optional, List, Dict, Any, Set, Union, AsyncIterator, Awaitable, Callable, Deque, Iterator, Mapping, Tuple
+from datetime import datetime, timedelta, timezone
+from contextvars import ContextVar
+from dataclasses import dataclass, field, replace
+from types import MappingProxyType
+from collections import Counter, defaultdict, deque
+from itertools import islice
 from enum import Enum
-import uuid
+from uuid_utils import uuid7
+from cachetools import TTLCache
 import asyncio
 import json
+import time
 import re
+import heapq
+import ahocorasick
+import orjson
 
 app = FastAPI(
     title="AI-Assistant Service",
     description="Omnipresent AI Copilot for AI-Suite",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 
 app.add_middleware(
@@ -38,6 +52,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ============== Request Clock ==============
+
+# Timestamp shared by every model created while handling one request
+request_now: ContextVar[Optional[datetime]] = ContextVar("request_now", default=None)
+
+def utcnow() -> datetime:
+    """Return the current request's timestamp, or a fresh one outside a request."""
+    return request_now.get() or datetime.utcnow()
+
+class RequestClockMiddleware:
+    """Capture a single timestamp per HTTP request for all default factories.
+
+    Plain ASGI rather than @app.middleware("http"), which would add a
+    BaseHTTPMiddleware task and stream hop to every request.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = request_now.set(datetime.utcnow())
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_now.reset(token)
+
+app.add_middleware(RequestClockMiddleware)
+
+# (epoch day, ISO date) for the current UTC day, refreshed on rollover
+today_iso_cache: List[Any] = [-1, ""]
+
+def utc_today_iso() -> str:
+    """Return today's UTC date as an ISO string, recomputed once per day."""
+    day = int(time.time()) // 86400
+    if today_iso_cache[0] != day:
+        today_iso_cache[:] = [day, datetime.utcfromtimestamp(day * 86400).date().isoformat()]
+    return today_iso_cache[1]
+
+# ============== Identifiers ==============
+
+def new_id() -> str:
+    """Return a time-ordered UUIDv7 as 32 hex chars, so ids sort by creation."""
+    return uuid7().hex
+
 # ============== Enums ==============
 
 class MessageRole(str, Enum):
@@ -113,25 +174,41 @@ class FeedbackType(str, Enum):
 # ============== Models ==============
 
 class Message(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     role: MessageRole
     content: str
     function_call: Optional[Dict[str, Any]] = None
     function_result: Optional[Dict[str, Any]] = None
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    timestamp: datetime = Field(default_factory=utcnow)
     metadata: Dict[str, Any] = {}
 
 class Conversation(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     user_id: str
     title: Optional[str] = None
     messages: List[Message] = []
     context: AppContext = AppContext.GLOBAL
     active_document_id: Optional[str] = None
     active_app_state: Dict[str, Any] = {}
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=utcnow)
+    updated_at: datetime = Field(default_factory=utcnow)
     is_archived: bool = False
+    _history: "MessageColumns" = PrivateAttr(
+        default_factory=lambda: MessageColumns(MAX_CONVERSATION_MESSAGES)
+    )
+
+    def add_message(self, message: "InternalMessage") -> None:
+        """Append a message, spilling the oldest one to the overflow store once full."""
+        evicted = self._history.append(message)
+        if evicted:
+            overflow_messages_db.setdefault(self.id, []).append(evicted)
+
+    @model_serializer(mode="wrap")
+    def _serialize_history(self, handler, info: SerializationInfo):
+        """Materialize the internal history as API messages on serialization."""
+        data = handler(self)
+        data["messages"] = self._history.to_dicts(info.mode)
+        return data
 
 class Intent(BaseModel):
     category: IntentCategory
@@ -149,7 +226,7 @@ class ActionResult(BaseModel):
     affected_items: List[Dict[str, Any]] = []
 
 class Suggestion(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     type: SuggestionType
     title: str
     description: Optional[str] = None
@@ -176,27 +253,164 @@ class UserPreferences(BaseModel):
     keyboard_shortcuts: bool = True
     default_apps: Dict[str, str] = {}
     custom_commands: List[Dict[str, Any]] = []
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=utcnow)
+    updated_at: datetime = Field(default_factory=utcnow)
 
 class KnowledgeEntry(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     user_id: Optional[str] = None  # None for global knowledge
     category: str
     title: str
     content: str
     keywords: List[str] = []
     source: Optional[str] = None
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=utcnow)
 
 class CommandHistory(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     user_id: str
     command: str
     intent: IntentCategory
     success: bool
     execution_time_ms: int
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    timestamp: datetime = Field(default_factory=utcnow)
+
+# ============== Internal Models ==============
+# Slotted dataclasses used on the chat hot path; converted to the
+# Pydantic models above only when crossing the HTTP boundary.
+
+@dataclass(slots=True)
+class InternalMessage:
+    role: MessageRole
+    content: str
+    id: str = field(default_factory=new_id)
+    function_call: Optional[Dict[str, Any]] = None
+    function_result: Optional[Dict[str, Any]] = None
+    timestamp: datetime = field(default_factory=utcnow)
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    def to_pydantic(self) -> Message:
+        return Message(
+            id=self.id,
+            role=self.role,
+            content=self.content,
+            function_call=self.function_call,
+            function_result=self.function_result,
+            timestamp=self.timestamp,
+            metadata=self.metadata,
+        )
+
+MESSAGE_ROLES = tuple(MessageRole)
+MESSAGE_ROLE_ORDINALS = {role: i for i, role in enumerate(MESSAGE_ROLES)}
+MESSAGE_EXTRA_FIELDS = ("function_call", "function_result", "metadata")
+
+class MessageColumns:
+    """Conversation history stored column-wise and bounded to maxlen rows."""
+
+    __slots__ = ("maxlen", "ids", "roles", "contents", "timestamps", "extras")
+
+    def __init__(self, maxlen: int):
+        self.maxlen = maxlen
+        self.ids: Deque[str] = deque()
+        self.roles: Deque[int] = deque()  # Ordinals into MESSAGE_ROLES
+        self.contents: Deque[str] = deque()
+        self.timestamps: Deque[float] = deque()  # Unix seconds, UTC
+        self.extras: Dict[str, Dict[str, Any]] = {}  # Only for messages that set optional fields
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[InternalMessage]:
+        for message_id, role, content, ts in zip(self.ids, self.roles, self.contents, self.timestamps):
+            yield InternalMessage(
+                id=message_id,
+                role=MESSAGE_ROLES[role],
+                content=content,
+                timestamp=datetime.utcfromtimestamp(ts),
+                **self.extras.get(message_id, {}),
+            )
+
+    def append(self, message: InternalMessage) -> Optional[InternalMessage]:
+        """Append a message, returning the oldest one if it had to be evicted."""
+        evicted = self.popleft() if len(self.ids) >= self.maxlen else None
+        self.ids.append(message.id)
+        self.roles.append(MESSAGE_ROLE_ORDINALS[message.role])
+        self.contents.append(message.content)
+        self.timestamps.append(message.timestamp.replace(tzinfo=timezone.utc).timestamp())
+        extras = {name: getattr(message, name) for name in MESSAGE_EXTRA_FIELDS if getattr(message, name)}
+        if extras:
+            self.extras[message.id] = extras
+        return evicted
+
+    def popleft(self) -> InternalMessage:
+        """Remove and return the oldest message."""
+        message_id = self.ids.popleft()
+        return InternalMessage(
+            id=message_id,
+            role=MESSAGE_ROLES[self.roles.popleft()],
+            content=self.contents.popleft(),
+            timestamp=datetime.utcfromtimestamp(self.timestamps.popleft()),
+            **self.extras.pop(message_id, {}),
+        )
+
+    def to_dicts(self, mode: str = "python") -> List[Dict[str, Any]]:
+        """Build API-shaped message dicts in one pass over the columns."""
+        json_mode = mode == "json"
+        messages = []
+        for message_id, role, content, ts in zip(self.ids, self.roles, self.contents, self.timestamps):
+            timestamp = datetime.utcfromtimestamp(ts)
+            message = {
+                "id": message_id,
+                "role": MESSAGE_ROLES[role].value if json_mode else MESSAGE_ROLES[role],
+                "content": content,
+                "function_call": None,
+                "function_result": None,
+                "timestamp": timestamp.isoformat() if json_mode else timestamp,
+                "metadata": {},
+            }
+            if message_id in self.extras:
+                message.update(self.extras[message_id])
+            messages.append(message)
+        return messages
+
+# Shared read-only default so intents without entities/parameters allocate nothing
+EMPTY_MAPPING: Mapping[str, Any] = MappingProxyType({})
+
+@dataclass(slots=True, frozen=True)
+class InternalIntent:
+    category: IntentCategory
+    confidence: float
+    entities: Mapping[str, Any] = field(default_factory=lambda: EMPTY_MAPPING)
+    parameters: Mapping[str, Any] = field(default_factory=lambda: EMPTY_MAPPING)
+    requires_confirmation: bool = False
+
+    def to_pydantic(self) -> Intent:
+        return Intent(
+            category=self.category,
+            confidence=self.confidence,
+            entities=dict(self.entities),
+            parameters=dict(self.parameters),
+            requires_confirmation=self.requires_confirmation,
+        )
+
+@dataclass(slots=True)
+class InternalActionResult:
+    success: bool
+    action: str
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    follow_up_actions: List[str] = field(default_factory=list)
+    affected_items: List[Dict[str, Any]] = field(default_factory=list)
+
+    def to_pydantic(self) -> ActionResult:
+        return ActionResult(
+            success=self.success,
+            action=self.action,
+            result=self.result,
+            error=self.error,
+            follow_up_actions=self.follow_up_actions,
+            affected_items=self.affected_items,
+        )
 
 # ============== Request/Response Models ==============
 
@@ -227,13 +441,53 @@ class VoiceRequest(BaseModel):
     audio_data: str  # Base64 encoded audio
     language: str = "en"
 
+class SpeechRequest(BaseModel):
+    text: str
+    language: str = "en"
+    voice: str = "default"
+
+class FeedbackRequest(BaseModel):
+    user_id: str
+    conversation_id: str
+    message_id: str
+    feedback_type: FeedbackType
+    comment: Optional[str] = None
+
 # ============== Storage (in-memory for demo) ==============
 
+MAX_CONVERSATION_MESSAGES = 200
+MAX_COMMAND_HISTORY = 10000
+
+# Whole ChatResponse objects keyed by (user_id, context, normalized prompt)
+response_cache: TTLCache = TTLCache(maxsize=10_000, ttl=300)
+
+# Intents whose actions create nothing, so a replayed response stays valid
+CACHEABLE_INTENTS = frozenset({
+    IntentCategory.SUMMARIZE_DOCUMENT,
+    IntentCategory.ANALYZE_DATA,
+    IntentCategory.CHECK_AVAILABILITY,
+    IntentCategory.LIST_TASKS,
+    IntentCategory.SEARCH_FILES,
+    IntentCategory.SEARCH,
+    IntentCategory.HELP,
+    IntentCategory.EXPLAIN,
+    IntentCategory.UNKNOWN,
+})
+
 conversations_db: Dict[str, Conversation] = {}
+overflow_messages_db: Dict[str, List[InternalMessage]] = {}  # Older messages beyond the in-memory window
 preferences_db: Dict[str, UserPreferences] = {}
 knowledge_db: Dict[str, KnowledgeEntry] = {}
-command_history_db: Dict[str, List[CommandHistory]] = {}
-active_sessions: Dict[str, Set[WebSocket]] = {}
+knowledge_search_fields: Dict[str, Tuple[int, str, str, str]] = {}  # id -> (seq, title, content, NUL-joined keywords), lowercased
+KNOWLEDGE_SEQ_SPAN = 1 << 40  # Upper bound on knowledge entry sequence numbers
+knowledge_trigram_index: Dict[str, Set[str]] = defaultdict(set)  # Trigram -> ids of entries containing it
+command_history_db: Dict[str, Deque[CommandHistory]] = defaultdict(lambda: deque(maxlen=MAX_COMMAND_HISTORY))  # Oldest first
+active_sessions: Dict[str, List[WebSocket]] = defaultdict(list)  # Live WebSockets per user
+
+# Usage counters kept in step with the stores above so /stats never scans them
+successful_command_counts: Counter = Counter()  # user_id -> successful commands in history
+intent_counts: Dict[str, Counter] = defaultdict(Counter)  # user_id -> intent -> commands in history
+conversation_counts: Counter = Counter()  # user_id -> stored conversations
 
 # ============== Intent Patterns ==============
 
@@ -304,6 +558,75 @@ INTENT_PATTERNS = {
     ],
 }
 
+def expand_literal_pattern(pattern: str) -> Optional[Set[str]]:
+    """Expand a pattern built only from literals, (?:a|b) groups and ? into all strings it matches.
+
+    Returns None when the pattern uses any other regex syntax.
+    """
+    def parse_alternation(i: int):
+        options, i = parse_sequence(i)
+        while i < len(pattern) and pattern[i] == "|":
+            more, i = parse_sequence(i + 1)
+            options |= more
+        return options, i
+
+    def parse_sequence(i: int):
+        strings = {""}
+        while i < len(pattern) and pattern[i] not in "|)":
+            if pattern.startswith("(?:", i):
+                item, i = parse_alternation(i + 3)
+                if i >= len(pattern) or pattern[i] != ")":
+                    raise ValueError(pattern)
+                i += 1
+            elif pattern[i] in "\\.^$*+?{}[]()":
+                raise ValueError(pattern)
+            else:
+                item, i = {pattern[i]}, i + 1
+            if i < len(pattern) and pattern[i] == "?":
+                item, i = item | {""}, i + 1
+            strings = {prefix + suffix for prefix in strings for suffix in item}
+        return strings, i
+
+    try:
+        strings, i = parse_alternation(0)
+    except ValueError:
+        return None
+    return strings if i == len(pattern) else None
+
+def build_intent_matcher():
+    """Compile INTENT_PATTERNS into an Aho-Corasick automaton plus regex fallbacks."""
+    automaton = ahocorasick.Automaton()
+    fallback = []
+    for priority, patterns in enumerate(INTENT_PATTERNS.values()):
+        for pattern in patterns:
+            literals = expand_literal_pattern(pattern)
+            if literals is None:
+                fallback.append((priority, re.compile(pattern)))
+                continue
+            for literal in literals:
+                # Keep the highest-priority category for shared literals
+                if literal not in automaton or automaton.get(literal) > priority:
+                    automaton.add_word(literal, priority)
+    automaton.make_automaton()
+    return automaton, fallback
+
+INTENT_ORDER = list(INTENT_PATTERNS)
+INTENT_AUTOMATON, INTENT_FALLBACK_PATTERNS = build_intent_matcher()
+
+# Date/time entities, compiled once; each is searched on its own so
+# overlapping matches (e.g. "next 12/25") still yield every entity
+DATE_ENTITY_PATTERNS = [
+    ("tomorrow", re.compile(r"tomorrow", re.IGNORECASE)),
+    ("next_weekday", re.compile(r"next (\w+)", re.IGNORECASE)),
+    ("date", re.compile(r"(\d{1,2})/(\d{1,2})")),
+    ("time", re.compile(r"at (\d{1,2}(?::\d{2})?\s*(?:am|pm)?)", re.IGNORECASE)),
+]
+
+EMAIL_PATTERN = re.compile(r"[\w\.-]+@[\w\.-]+\.\w+")
+
+# Capitalized name after a preposition; case-sensitive on purpose
+PERSON_PATTERN = re.compile(r"(?:to|with|for|from)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)")
+
 # ============== Quick Actions ==============
 
 QUICK_ACTIONS = [
@@ -317,6 +640,21 @@ QUICK_ACTIONS = [
     QuickAction(id="summarize", name="Summarize", icon="📝", command="summarize this", description="Summarize current content", category="ai"),
 ]
 
+QUICK_ACTION_CATEGORIES = {
+    AppContext.DOCS: ["documents", "ai", "general"],
+    AppContext.SHEETS: ["spreadsheets", "ai", "general"],
+    AppContext.MAIL: ["email", "ai", "general"],
+    AppContext.CALENDAR: ["calendar", "ai", "general"],
+    AppContext.TASKS: ["tasks", "ai", "general"],
+}
+
+# Quick actions are static, so filter them per context once at import
+QUICK_ACTIONS_BY_CONTEXT: Dict[AppContext, List[QuickAction]] = {
+    context: [a for a in QUICK_ACTIONS if a.category in QUICK_ACTION_CATEGORIES.get(context, ["general", "ai"])]
+    for context in AppContext
+}
+QUICK_ACTIONS_BY_CONTEXT[AppContext.GLOBAL] = QUICK_ACTIONS
+
 # ============== Helper Functions ==============
 
 def get_conversation(conversation_id: str) -> Conversation:
@@ -324,121 +662,142 @@ def get_conversation(conversation_id: str) -> Conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     return conversations_db[conversation_id]
 
-def detect_intent(message: str, context: AppContext) -> Intent:
+def get_user_preferences(user_id: str) -> UserPreferences:
+    """Get user preferences, creating the defaults only on first access."""
+    return preferences_db.get(user_id) or preferences_db.setdefault(user_id, UserPreferences(user_id=user_id))
+
+def trigrams(text: str) -> Set[str]:
+    """Return the set of 3-character substrings of text."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+# Joining keywords lets one C-level substring test replace a per-keyword loop;
+# a query without the separator cannot match across a keyword boundary
+KEYWORD_SEPARATOR = "\0"
+
+def index_knowledge_entry(entry: KnowledgeEntry) -> None:
+    """Lowercase an entry's searchable fields once and add them to the trigram index."""
+    title = entry.title.lower()
+    content = entry.content.lower()
+    keywords = tuple(kw.lower() for kw in entry.keywords)
+    knowledge_search_fields[entry.id] = (
+        len(knowledge_search_fields), title, content, KEYWORD_SEPARATOR.join(keywords),
+    )
+
+    grams = trigrams(title) | trigrams(content)
+    for keyword in keywords:
+        grams |= trigrams(keyword)
+    for gram in grams:
+        knowledge_trigram_index[gram].add(entry.id)
+
+def detect_intent(message: str, context: AppContext) -> InternalIntent:
     """Detect user intent from message."""
     message_lower = message.lower().strip()
 
-    for intent_category, patterns in INTENT_PATTERNS.items():
-        for pattern in patterns:
-            if re.search(pattern, message_lower):
-                return Intent(
-                    category=intent_category,
-                    confidence=0.85,
-                    entities=extract_entities(message),
-                )
+    # One automaton pass finds every literal hit; the earliest category in
+    # INTENT_PATTERNS wins, as with the original ordered regex scan
+    best = len(INTENT_ORDER)
+    if INTENT_AUTOMATON.kind == ahocorasick.AHOCORASICK:
+        for _, priority in INTENT_AUTOMATON.iter(message_lower):
+            best = min(best, priority)
+
+    for priority, pattern in INTENT_FALLBACK_PATTERNS:
+        if priority >= best:
+            break
+        if pattern.search(message_lower):
+            best = priority
+            break
+
+    if best < len(INTENT_ORDER):
+        return InternalIntent(
+            category=INTENT_ORDER[best],
+            confidence=0.85,
+            entities=extract_entities(message),
+        )
 
     # Context-specific defaults
     if context == AppContext.DOCS:
         if "write" in message_lower or "add" in message_lower:
-            return Intent(category=IntentCategory.EDIT_DOCUMENT, confidence=0.7)
+            return InternalIntent(category=IntentCategory.EDIT_DOCUMENT, confidence=0.7)
     elif context == AppContext.SHEETS:
         if "calculate" in message_lower or "formula" in message_lower:
-            return Intent(category=IntentCategory.WRITE_FORMULA, confidence=0.8)
+            return InternalIntent(category=IntentCategory.WRITE_FORMULA, confidence=0.8)
     elif context == AppContext.MAIL:
-        return Intent(category=IntentCategory.COMPOSE_EMAIL, confidence=0.6)
+        return InternalIntent(category=IntentCategory.COMPOSE_EMAIL, confidence=0.6)
 
-    return Intent(category=IntentCategory.UNKNOWN, confidence=0.5)
+    return InternalIntent(category=IntentCategory.UNKNOWN, confidence=0.5)
 
 def extract_entities(message: str) -> Dict[str, Any]:
     """Extract entities from message."""
     entities = {}
 
     # Date/time extraction
-    date_patterns = [
-        (r"tomorrow", "tomorrow"),
-        (r"next (\w+)", "next_weekday"),
-        (r"(\d{1,2})/(\d{1,2})", "date"),
-        (r"at (\d{1,2}(?::\d{2})?\s*(?:am|pm)?)", "time"),
-    ]
-
-    for pattern, entity_type in date_patterns:
-        match = re.search(pattern, message.lower())
+    for entity_type, pattern in DATE_ENTITY_PATTERNS:
+        match = pattern.search(message)
         if match:
-            entities[entity_type] = match.group(0)
+            entities[entity_type] = match.group(0).lower()
 
     # Email extraction
-    email_match = re.search(r'[\w\.-]+@[\w\.-]+\.\w+', message)
+    email_match = EMAIL_PATTERN.search(message)
     if email_match:
         entities["email"] = email_match.group(0)
 
     # Person name extraction (simple heuristic)
-    name_patterns = [
-        r"(?:to|with|for|from)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)",
-    ]
-    for pattern in name_patterns:
-        match = re.search(pattern, message)
-        if match:
-            entities["person"] = match.group(1)
+    match = PERSON_PATTERN.search(message)
+    if match:
+        entities["person"] = match.group(1)
 
     return entities
 
-async def execute_action(intent: Intent, user_id: str, context: AppContext) -> ActionResult:
+async def execute_action(intent: InternalIntent, user_id: str, context: AppContext) -> InternalActionResult:
     """Execute an action based on intent."""
-    action_handlers = {
-        IntentCategory.CREATE_DOCUMENT: handle_create_document,
-        IntentCategory.COMPOSE_EMAIL: handle_compose_email,
-        IntentCategory.SCHEDULE_MEETING: handle_schedule_meeting,
-        IntentCategory.CREATE_TASK: handle_create_task,
-        IntentCategory.LIST_TASKS: handle_list_tasks,
-        IntentCategory.SEARCH_FILES: handle_search_files,
-        IntentCategory.ANALYZE_DATA: handle_analyze_data,
-        IntentCategory.SUMMARIZE_DOCUMENT: handle_summarize,
-    }
-
-    handler = action_handlers.get(intent.category)
+    handler = ACTION_HANDLERS.get(intent.category)
     if handler:
         return await handler(intent, user_id, context)
 
-    return ActionResult(
+    return InternalActionResult(
         success=False,
         action=intent.category.value,
         error="Action not implemented yet",
     )
 
-async def handle_create_document(intent: Intent, user_id: str, context: AppContext) -> ActionResult:
+async def execute_actions(intents: List[InternalIntent], user_id: str, context: AppContext) -> List[InternalActionResult]:
+    """Execute several intents concurrently, preserving their order."""
+    return list(await asyncio.gather(*(execute_action(intent, user_id, context) for intent in intents)))
+
+async def handle_create_document(intent: InternalIntent, user_id: str, context: AppContext) -> InternalActionResult:
     """Handle document creation."""
-    return ActionResult(
+    return InternalActionResult(
         success=True,
         action="create_document",
         result={
-            "document_id": str(uuid.uuid4()),
+            "document_id": new_id(),
             "title": "New Document",
             "url": "/docs/new",
         },
         follow_up_actions=["Open document", "Add title", "Start writing"],
     )
 
-async def handle_compose_email(intent: Intent, user_id: str, context: AppContext) -> ActionResult:
+async def handle_compose_email(intent: InternalIntent, user_id: str, context: AppContext) -> InternalActionResult:
     """Handle email composition."""
     recipient = intent.entities.get("email") or intent.entities.get("person")
-    return ActionResult(
+    return InternalActionResult(
         success=True,
         action="compose_email",
         result={
-            "draft_id": str(uuid.uuid4()),
+            "draft_id": new_id(),
             "to": recipient,
             "url": "/mail/compose",
         },
         follow_up_actions=["Add recipient", "Write subject", "Compose message"],
     )
 
-async def handle_schedule_meeting(intent: Intent, user_id: str, context: AppContext) -> ActionResult:
+async def handle_schedule_meeting(intent: InternalIntent, user_id: str, context: AppContext) -> InternalActionResult:
     """Handle meeting scheduling."""
-    return ActionResult(
+    return InternalActionResult(
         success=True,
         action="schedule_meeting",
         result={
-            "event_id": str(uuid.uuid4()),
+            "event_id": new_id(),
             "suggested_times": [
                 "Tomorrow at 10:00 AM",
                 "Tomorrow at 2:00 PM",
@@ -449,21 +808,21 @@ async def handle_schedule_meeting(intent: Intent, user_id: str, context: AppCont
         follow_up_actions=["Select time", "Add attendees", "Set agenda"],
     )
 
-async def handle_create_task(intent: Intent, user_id: str, context: AppContext) -> ActionResult:
+async def handle_create_task(intent: InternalIntent, user_id: str, context: AppContext) -> InternalActionResult:
     """Handle task creation."""
-    return ActionResult(
+    return InternalActionResult(
         success=True,
         action="create_task",
         result={
-            "task_id": str(uuid.uuid4()),
+            "task_id": new_id(),
             "url": "/tasks/new",
         },
         follow_up_actions=["Set due date", "Add to project", "Set priority"],
     )
 
-async def handle_list_tasks(intent: Intent, user_id: str, context: AppContext) -> ActionResult:
+async def handle_list_tasks(intent: InternalIntent, user_id: str, context: AppContext) -> InternalActionResult:
     """Handle task listing."""
-    return ActionResult(
+    return InternalActionResult(
         success=True,
         action="list_tasks",
         result={
@@ -476,9 +835,9 @@ async def handle_list_tasks(intent: Intent, user_id: str, context: AppContext) -
         },
     )
 
-async def handle_search_files(intent: Intent, user_id: str, context: AppContext) -> ActionResult:
+async def handle_search_files(intent: InternalIntent, user_id: str, context: AppContext) -> InternalActionResult:
     """Handle file search."""
-    return ActionResult(
+    return InternalActionResult(
         success=True,
         action="search_files",
         result={
@@ -490,9 +849,9 @@ async def handle_search_files(intent: Intent, user_id: str, context: AppContext)
         },
     )
 
-async def handle_analyze_data(intent: Intent, user_id: str, context: AppContext) -> ActionResult:
+async def handle_analyze_data(intent: InternalIntent, user_id: str, context: AppContext) -> InternalActionResult:
     """Handle data analysis."""
-    return ActionResult(
+    return InternalActionResult(
         success=True,
         action="analyze_data",
         result={
@@ -505,9 +864,9 @@ async def handle_analyze_data(intent: Intent, user_id: str, context: AppContext)
         },
     )
 
-async def handle_summarize(intent: Intent, user_id: str, context: AppContext) -> ActionResult:
+async def handle_summarize(intent: InternalIntent, user_id: str, context: AppContext) -> InternalActionResult:
     """Handle document summarization."""
-    return ActionResult(
+    return InternalActionResult(
         success=True,
         action="summarize",
         result={
@@ -520,7 +879,18 @@ async def handle_summarize(intent: Intent, user_id: str, context: AppContext) ->
         },
     )
 
-def generate_response(intent: Intent, action_result: ActionResult, context: AppContext) -> str:
+ACTION_HANDLERS: Dict[IntentCategory, Callable[[InternalIntent, str, AppContext], Awaitable[InternalActionResult]]] = {
+    IntentCategory.CREATE_DOCUMENT: handle_create_document,
+    IntentCategory.COMPOSE_EMAIL: handle_compose_email,
+    IntentCategory.SCHEDULE_MEETING: handle_schedule_meeting,
+    IntentCategory.CREATE_TASK: handle_create_task,
+    IntentCategory.LIST_TASKS: handle_list_tasks,
+    IntentCategory.SEARCH_FILES: handle_search_files,
+    IntentCategory.ANALYZE_DATA: handle_analyze_data,
+    IntentCategory.SUMMARIZE_DOCUMENT: handle_summarize,
+}
+
+def generate_response(intent: InternalIntent, action_result: InternalActionResult, context: AppContext) -> str:
     """Generate a natural language response."""
     if not action_result.success:
         return f"I couldn't complete that action. {action_result.error}"
@@ -538,7 +908,7 @@ def generate_response(intent: Intent, action_result: ActionResult, context: AppC
 
     return response_templates.get(intent.category, "Done! Is there anything else I can help you with?")
 
-def get_suggestions(intent: Intent, context: AppContext, user_id: str) -> List[Suggestion]:
+def get_suggestions(intent: InternalIntent, context: AppContext, user_id: str) -> List[Suggestion]:
     """Generate contextual suggestions."""
     suggestions = []
 
@@ -573,11 +943,55 @@ def get_suggestions(intent: Intent, context: AppContext, user_id: str) -> List[S
 
     return suggestions
 
+def record_command(user_id: str, entry: CommandHistory) -> None:
+    """Append to a user's command history, keeping usage counters in step."""
+    history = command_history_db[user_id]
+    intents = intent_counts[user_id]
+    if len(history) == history.maxlen:
+        evicted = history[0]
+        intents[evicted.intent.value] -= 1
+        if not intents[evicted.intent.value]:
+            # Drop zero counts so most_common() only reports intents still in history
+            del intents[evicted.intent.value]
+        if evicted.success:
+            successful_command_counts[user_id] -= 1
+    history.append(entry)
+    intents[entry.intent.value] += 1
+    if entry.success:
+        successful_command_counts[user_id] += 1
+
+# ============== Response Cache ==============
+
+def normalize_message(message: str) -> str:
+    """Normalize a prompt for response cache lookups."""
+    return re.sub(r"\s+", " ", message.lower().strip())
+
+def evict_cached_response(user_id: str, conversation_id: str, message_id: str) -> None:
+    """Drop the cached response for the prompt that produced an assistant message."""
+    conversation = conversations_db.get(conversation_id)
+    if not conversation:
+        return
+
+    prompt = None
+    for message in conversation._history:
+        if message.id == message_id:
+            break
+        if message.role == MessageRole.USER:
+            prompt = message.content
+    else:
+        return
+
+    if prompt is not None:
+        normalized = normalize_message(prompt)
+        for context in AppContext:
+            response_cache.pop((user_id, context.value, normalized), None)
+
 # ============== Main Chat Endpoint ==============
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(user_id: str, request: ChatRequest):
-    """Main chat endpoint for AI assistant."""
+async def stream_chat(user_id: str, request: ChatRequest) -> AsyncIterator[Dict[str, Any]]:
+    """Process a chat turn, yielding intent, token and response frames as they are ready."""
+    now = utcnow()
+
     # Get or create conversation
     if request.conversation_id:
         conversation = conversations_db.get(request.conversation_id)
@@ -586,72 +1000,106 @@ async def chat(user_id: str, request: ChatRequest):
                 id=request.conversation_id,
                 user_id=user_id,
                 context=request.context,
+                created_at=now,
+                updated_at=now,
             )
             conversations_db[conversation.id] = conversation
+            conversation_counts[user_id] += 1
     else:
         conversation = Conversation(
             user_id=user_id,
             context=request.context,
             active_document_id=request.active_document_id,
             active_app_state=request.app_state or {},
+            created_at=now,
+            updated_at=now,
         )
         conversations_db[conversation.id] = conversation
+        conversation_counts[user_id] += 1
 
     # Add user message
-    user_message = Message(role=MessageRole.USER, content=request.message)
-    conversation.messages.append(user_message)
-
-    # Detect intent
-    intent = detect_intent(request.message, request.context)
-
-    # Execute action if confident enough
-    actions_performed = []
-    if intent.confidence >= 0.7 and intent.category != IntentCategory.UNKNOWN:
-        action_result = await execute_action(intent, user_id, request.context)
-        actions_performed.append(action_result)
-
-    # Generate response
-    response_text = generate_response(intent, actions_performed[0] if actions_performed else ActionResult(success=False, action=""), request.context)
-
-    # Get suggestions
-    suggestions = get_suggestions(intent, request.context, user_id)
-
-    # Generate quick replies
-    quick_replies = []
-    if intent.category == IntentCategory.SCHEDULE_MEETING:
-        quick_replies = ["Tomorrow at 10 AM", "Tomorrow at 2 PM", "Pick another time"]
-    elif intent.category == IntentCategory.CREATE_TASK:
-        quick_replies = ["High priority", "Set due date", "Add to project"]
-    elif intent.category == IntentCategory.UNKNOWN:
-        quick_replies = ["Help", "Show my tasks", "Check calendar"]
+    user_message = InternalMessage(role=MessageRole.USER, content=request.message, timestamp=now)
+    conversation.add_message(user_message)
+
+    cache_key = (user_id, request.context.value, normalize_message(request.message))
+    cached = response_cache.get(cache_key)
+
+    if cached:
+        # Repeated prompt: replay the cached response into this conversation
+        response = cached.model_copy(update={"conversation_id": conversation.id})
+        yield {"type": "intent", "conversation_id": conversation.id, "intent": response.intent}
+        for chunk in re.findall(r"\S+\s*", response.message):
+            yield {"type": "token", "chunk": chunk}
+    else:
+        # Detect intent
+        intent = detect_intent(request.message, request.context)
+        yield {"type": "intent", "conversation_id": conversation.id, "intent": intent.to_pydantic()}
+
+        # Execute action if confident enough, building suggestions meanwhile
+        actions_performed = []
+        action_task = None
+        if intent.confidence >= 0.7 and intent.category != IntentCategory.UNKNOWN:
+            action_task = asyncio.ensure_future(execute_action(intent, user_id, request.context))
+
+        # Get suggestions
+        suggestions = get_suggestions(intent, request.context, user_id)
+
+        if action_task:
+            actions_performed.append(await action_task)
+
+        # Generate response
+        response_text = generate_response(intent, actions_performed[0] if actions_performed else InternalActionResult(success=False, action=""), request.context)
+        for chunk in re.findall(r"\S+\s*", response_text):
+            yield {"type": "token", "chunk": chunk}
+
+        # Generate quick replies
+        quick_replies = []
+        if intent.category == IntentCategory.SCHEDULE_MEETING:
+            quick_replies = ["Tomorrow at 10 AM", "Tomorrow at 2 PM", "Pick another time"]
+        elif intent.category == IntentCategory.CREATE_TASK:
+            quick_replies = ["High priority", "Set due date", "Add to project"]
+        elif intent.category == IntentCategory.UNKNOWN:
+            quick_replies = ["Help", "Show my tasks", "Check calendar"]
+
+        response = ChatResponse(
+            message=response_text,
+            conversation_id=conversation.id,
+            intent=intent.to_pydantic(),
+            actions_performed=[a.to_pydantic() for a in actions_performed],
+            suggestions=suggestions,
+            quick_replies=quick_replies,
+            requires_more_info=intent.category == IntentCategory.UNKNOWN,
+            follow_up_questions=["What would you like to do next?"] if not quick_replies else [],
+        )
+        if intent.category in CACHEABLE_INTENTS:
+            response_cache[cache_key] = response
 
     # Add assistant message
-    assistant_message = Message(role=MessageRole.ASSISTANT, content=response_text)
-    conversation.messages.append(assistant_message)
-    conversation.updated_at = datetime.utcnow()
+    assistant_message = InternalMessage(role=MessageRole.ASSISTANT, content=response.message, timestamp=now)
+    conversation.add_message(assistant_message)
+    conversation.updated_at = now
 
     # Record command history
     history_entry = CommandHistory(
         user_id=user_id,
         command=request.message,
-        intent=intent.category,
-        success=len(actions_performed) > 0 and actions_performed[0].success,
+        intent=response.intent.category,
+        success=len(response.actions_performed) > 0 and response.actions_performed[0].success,
         execution_time_ms=100,  # Would be actual timing
+        timestamp=now,
     )
-    if user_id not in command_history_db:
-        command_history_db[user_id] = []
-    command_history_db[user_id].append(history_entry)
-
-    return ChatResponse(
-        message=response_text,
-        conversation_id=conversation.id,
-        intent=intent,
-        actions_performed=actions_performed,
-        suggestions=suggestions,
-        quick_replies=quick_replies,
-        requires_more_info=intent.category == IntentCategory.UNKNOWN,
-        follow_up_questions=["What would you like to do next?"] if not quick_replies else [],
-    )
+    record_command(user_id, history_entry)
+
+    yield {"type": "response", "data": response}
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(user_id: str, request: ChatRequest):
+    """Main chat endpoint for AI assistant."""
+    response = None
+    async for frame in stream_chat(user_id, request):
+        if frame["type"] == "response":
+            response = frame["data"]
+    return response
 
 # ============== Conversation Endpoints ==============
 
@@ -678,8 +1126,10 @@ async def get_conversation_details(conversation_id: str):
 @app.delete("/conversations/{conversation_id}")
 async def delete_conversation(conversation_id: str):
     """Delete a conversation."""
-    get_conversation(conversation_id)
+    conversation = get_conversation(conversation_id)
     del conversations_db[conversation_id]
+    conversation_counts[conversation.user_id] -= 1
+    overflow_messages_db.pop(conversation_id, None)
     return {"message": "Conversation deleted"}
 
 @app.post("/conversations/{conversation_id}/archive")
@@ -697,26 +1147,15 @@ async def execute_command(user_id: str, request: CommandRequest):
     intent = detect_intent(request.command, request.context)
 
     if request.parameters:
-        intent.parameters.update(request.parameters)
+        intent = replace(intent, parameters={**intent.parameters, **request.parameters})
 
-    return await execute_action(intent, user_id, request.context)
+    action_result = await execute_action(intent, user_id, request.context)
+    return action_result.to_pydantic()
 
 @app.get("/commands/quick-actions", response_model=List[QuickAction])
 async def get_quick_actions(context: AppContext = AppContext.GLOBAL):
     """Get available quick actions."""
-    if context == AppContext.GLOBAL:
-        return QUICK_ACTIONS
-
-    context_filters = {
-        AppContext.DOCS: ["documents", "ai", "general"],
-        AppContext.SHEETS: ["spreadsheets", "ai", "general"],
-        AppContext.MAIL: ["email", "ai", "general"],
-        AppContext.CALENDAR: ["calendar", "ai", "general"],
-        AppContext.TASKS: ["tasks", "ai", "general"],
-    }
-
-    allowed_categories = context_filters.get(context, ["general", "ai"])
-    return [a for a in QUICK_ACTIONS if a.category in allowed_categories]
+    return QUICK_ACTIONS_BY_CONTEXT[context]
 
 @app.get("/commands/history")
 async def get_command_history(
@@ -724,8 +1163,9 @@ async def get_command_history(
     limit: int = Query(50, ge=1, le=200),
 ):
     """Get command history."""
-    history = command_history_db.get(user_id, [])
-    return sorted(history, key=lambda x: x.timestamp, reverse=True)[:limit]
+    # Entries are appended in timestamp order, so newest-first is a reverse walk
+    history = command_history_db.get(user_id, ())
+    return list(islice(reversed(history), limit))
 
 # ============== Suggestions Endpoints ==============
 
@@ -739,7 +1179,7 @@ async def get_proactive_suggestions(
     suggestions = []
 
     # Time-based suggestions
-    now = datetime.utcnow()
+    now = utcnow()
     hour = now.hour
 
     if 8 <= hour < 10:
@@ -781,9 +1221,7 @@ async def dismiss_suggestion(suggestion_id: str, user_id: str):
 @app.get("/preferences/{user_id}", response_model=UserPreferences)
 async def get_preferences(user_id: str):
     """Get user preferences."""
-    if user_id not in preferences_db:
-        preferences_db[user_id] = UserPreferences(user_id=user_id)
-    return preferences_db[user_id]
+    return get_user_preferences(user_id)
 
 @app.put("/preferences/{user_id}", response_model=UserPreferences)
 async def update_preferences(
@@ -794,10 +1232,7 @@ async def update_preferences(
     voice_enabled: Optional[bool] = None,
 ):
     """Update user preferences."""
-    if user_id not in preferences_db:
-        preferences_db[user_id] = UserPreferences(user_id=user_id)
-
-    prefs = preferences_db[user_id]
+    prefs = get_user_preferences(user_id)
 
     if preferred_language:
         prefs.preferred_language = preferred_language
@@ -808,7 +1243,7 @@ async def update_preferences(
     if voice_enabled is not None:
         prefs.voice_enabled = voice_enabled
 
-    prefs.updated_at = datetime.utcnow()
+    prefs.updated_at = utcnow()
     return prefs
 
 # ============== Knowledge Base ==============
@@ -830,6 +1265,7 @@ async def add_knowledge(
         keywords=keywords,
     )
     knowledge_db[entry.id] = entry
+    index_knowledge_entry(entry)
     return entry
 
 @app.get("/knowledge/search")
@@ -840,46 +1276,58 @@ async def search_knowledge(
     limit: int = Query(10, ge=1, le=50),
 ):
     """Search knowledge base."""
-    entries = list(knowledge_db.values())
-
-    if category:
-        entries = [e for e in entries if e.category == category]
-
-    # Filter by user (include global + user-specific)
-    if user_id:
-        entries = [e for e in entries if e.user_id is None or e.user_id == user_id]
-
-    # Simple keyword search
     query_lower = query.lower()
-    results = []
-    for entry in entries:
-        score = 0
-        if query_lower in entry.title.lower():
-            score += 2
-        if query_lower in entry.content.lower():
-            score += 1
-        if any(query_lower in kw.lower() for kw in entry.keywords):
-            score += 1.5
-        if score > 0:
-            results.append({"entry": entry, "score": score})
-
-    results.sort(key=lambda x: x["score"], reverse=True)
-    return [r["entry"] for r in results[:limit]]
+    plain_query = KEYWORD_SEPARATOR not in query_lower
+
+    # A substring match needs every query trigram somewhere in the entry, so
+    # intersecting postings yields a candidate superset; short queries scan all
+    query_grams = trigrams(query_lower)
+    if query_grams:
+        postings = sorted((knowledge_trigram_index.get(g, set()) for g in query_grams), key=len)
+        candidate_ids = set.intersection(*postings)
+    else:
+        candidate_ids = list(knowledge_db)
+
+    # Simple keyword search; ranks and entries are kept as parallel lists
+    ranks: List[int] = []
+    entries: List[KnowledgeEntry] = []
+    for entry_id in candidate_ids:
+        entry = knowledge_db[entry_id]
+        if category and entry.category != category:
+            continue
+        # Filter by user (include global + user-specific)
+        if user_id and not (entry.user_id is None or entry.user_id == user_id):
+            continue
+
+        seq, title, content, keyword_blob = knowledge_search_fields[entry_id]
+        # Scores are counted in half points so they stay integral
+        half_points = 0
+        if query_lower in title:
+            half_points += 4
+        if query_lower in content:
+            half_points += 2
+        if (query_lower in keyword_blob if plain_query
+                else any(query_lower in kw for kw in keyword_blob.split(KEYWORD_SEPARATOR))):
+            half_points += 3
+        if half_points:
+            # Score first, then insertion order breaks ties, in a single int
+            ranks.append(half_points * KNOWLEDGE_SEQ_SPAN - seq)
+            entries.append(entry)
+
+    top = heapq.nlargest(limit, range(len(ranks)), key=ranks.__getitem__)
+    return [entries[i] for i in top]
 
 # ============== Feedback ==============
 
 @app.post("/feedback")
-async def submit_feedback(
-    user_id: str,
-    conversation_id: str,
-    message_id: str,
-    feedback_type: FeedbackType,
-    comment: Optional[str] = None,
-):
+async def submit_feedback(request: FeedbackRequest):
     """Submit feedback on assistant response."""
+    if request.feedback_type == FeedbackType.INCORRECT:
+        evict_cached_response(request.user_id, request.conversation_id, request.message_id)
+
     return {
         "message": "Thank you for your feedback!",
-        "feedback_type": feedback_type,
+        "feedback_type": request.feedback_type,
     }
 
 # ============== Voice ==============
@@ -895,28 +1343,88 @@ async def transcribe_voice(request: VoiceRequest):
     }
 
 @app.post("/voice/speak")
-async def text_to_speech(text: str, language: str = "en", voice: str = "default"):
+async def text_to_speech(request: SpeechRequest):
     """Convert text to speech."""
     # In real implementation, use text-to-speech service
     return {
         "audio_url": "/audio/generated.mp3",
-        "duration_seconds": len(text) / 15,  # Rough estimate
+        "duration_seconds": len(request.text) / 15,  # Rough estimate
     }
 
 # ============== WebSocket for Real-time ==============
 
+def drop_session(user_id: str, websocket: WebSocket) -> None:
+    """Swap-remove a closed WebSocket from the user's live sessions."""
+    sessions = active_sessions.get(user_id)
+    if not sessions:
+        return
+    try:
+        i = sessions.index(websocket)
+    except ValueError:
+        return
+    sessions[i] = sessions[-1]
+    sessions.pop()
+    if not sessions:
+        del active_sessions[user_id]
+
+PONG_FRAME = '{"type":"pong"}'
+
+async def receive_message(websocket: WebSocket) -> Any:
+    """Receive one JSON message, text or binary, decoded with orjson."""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    text = message.get("text")
+    return orjson.loads(text if text is not None else message["bytes"])
+
+def encode_frame(frame: Any) -> str:
+    """Serialize a frame with orjson, falling back to FastAPI's encoder for models."""
+    return orjson.dumps(frame, default=jsonable_encoder).decode()
+
+async def broadcast(user_id: str, frame: Any) -> None:
+    """Send one frame to every live session of a user, serialized once."""
+    sessions = active_sessions.get(user_id)
+    if not sessions:
+        return
+    payload = encode_frame(frame)
+    # Snapshot the list; drop_session may swap-remove while sends are pending
+    await asyncio.gather(*(ws.send_text(payload) for ws in tuple(sessions)), return_exceptions=True)
+
+@app.websocket("/ws/chat")
+async def websocket_chat_stream(websocket: WebSocket, user_id: str):
+    """WebSocket that streams each chat turn frame by frame."""
+    await websocket.accept()
+
+    active_sessions[user_id].append(websocket)
+
+    try:
+        while True:
+            data = await receive_message(websocket)
+            request = ChatRequest(
+                message=data.get("message", ""),
+                conversation_id=data.get("conversation_id"),
+                context=AppContext(data.get("context", "global")),
+                active_document_id=data.get("active_document_id"),
+                app_state=data.get("app_state"),
+            )
+            async for frame in stream_chat(user_id, request):
+                await websocket.send_text(encode_frame(frame))
+
+    except WebSocketDisconnect:
+        pass
+    finally:
+        drop_session(user_id, websocket)
+
 @app.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
     """WebSocket for real-time assistant communication."""
     await websocket.accept()
 
-    if user_id not in active_sessions:
-        active_sessions[user_id] = set()
-    active_sessions[user_id].add(websocket)
+    active_sessions[user_id].append(websocket)
 
     try:
         while True:
-            data = await websocket.receive_json()
+            data = await receive_message(websocket)
 
             if data.get("type") == "chat":
                 # Process chat message
@@ -926,23 +1434,35 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
                     context=AppContext(data.get("context", "global")),
                 )
                 response = await chat(user_id, request)
-                await websocket.send_json({
-                    "type": "response",
-                    "data": response.model_dump(),
-                })
+                await websocket.send_text(
+                    '{"type":"response","data":' + response.model_dump_json() + "}"
+                )
 
             elif data.get("type") == "typing":
-                # User is typing - could trigger proactive suggestions
-                pass
+                # User is typing - push proactive suggestions to all their sessions
+                suggestions = await get_proactive_suggestions(
+                    user_id, AppContext(data.get("context", "global")), limit=5,
+                )
+                await broadcast(user_id, {"type": "suggestions", "data": suggestions})
 
             elif data.get("type") == "ping":
-                await websocket.send_json({"type": "pong"})
+                await websocket.send_text(PONG_FRAME)
 
     except WebSocketDisconnect:
-        active_sessions[user_id].discard(websocket)
+        pass
+    finally:
+        drop_session(user_id, websocket)
 
 # ============== Cross-App Actions ==============
 
+APP_RESULT_KEYS: Mapping[AppContext, str] = MappingProxyType({
+    AppContext.DOCS: "documents",
+    AppContext.MAIL: "emails",
+    AppContext.TASKS: "tasks",
+    AppContext.DRIVE: "files",
+    AppContext.CALENDAR: "events",
+})
+
 @app.post("/cross-app/search")
 async def cross_app_search(
     user_id: str,
@@ -960,27 +1480,24 @@ async def cross_app_search(
     }
 
     if apps:
-        app_map = {
-            AppContext.DOCS: "documents",
-            AppContext.MAIL: "emails",
-            AppContext.TASKS: "tasks",
-            AppContext.DRIVE: "files",
-            AppContext.CALENDAR: "events",
-        }
-        results = {app_map.get(app, app.value): results.get(app_map.get(app, ""), [])
-                   for app in apps if app_map.get(app) in results}
-
-    return {
+        selected = {}
+        for app in apps:
+            key = APP_RESULT_KEYS.get(app)
+            if key in results:
+                selected[key] = results[key]
+        results = selected
+
+    return ORJSONResponse({
         "query": query,
         "results": results,
-        "total": sum(len(v) for v in results.values()),
-    }
+        "total": sum(map(len, results.values())),
+    })
 
 @app.post("/cross-app/daily-briefing")
 async def get_daily_briefing(user_id: str):
     """Get a daily briefing across all apps."""
-    return {
-        "date": datetime.utcnow().date().isoformat(),
+    return ORJSONResponse({
+        "date": utc_today_iso(),
         "calendar": {
             "events_today": 3,
             "next_event": {"title": "Team Standup", "time": "10:00 AM"},
@@ -994,35 +1511,36 @@ async def get_daily_briefing(user_id: str):
             "overdue": 1,
         },
         "summary": "You have 3 meetings today, 12 unread emails (2 important), and 4 tasks due.",
-    }
+    })
 
 # ============== Statistics ==============
 
 @app.get("/stats/{user_id}")
 async def get_assistant_stats(user_id: str):
     """Get assistant usage statistics."""
-    history = command_history_db.get(user_id, [])
+    history = command_history_db.get(user_id, ())
+    intents = intent_counts.get(user_id, Counter())
 
-    return {
+    return ORJSONResponse({
         "total_commands": len(history),
-        "successful_commands": len([h for h in history if h.success]),
-        "conversations": len([c for c in conversations_db.values() if c.user_id == user_id]),
-        "most_used_intents": {},  # Would calculate from history
+        "successful_commands": successful_command_counts[user_id],
+        "conversations": conversation_counts[user_id],
+        "most_used_intents": dict(intents.most_common(5)),
         "average_response_time_ms": 150,
-    }
+    })
 
 # ============== Health Check ==============
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    return {
+    return ORJSONResponse({
         "status": "healthy",
         "service": "ai-assistant",
         "version": "1.0.0",
         "active_conversations": len(conversations_db),
         "active_sessions": sum(len(s) for s in active_sessions.values()),
-    }
+    })
 
 if __name__ == "__main__":
     import uvicorn
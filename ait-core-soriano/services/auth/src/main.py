@@ -7,18 +7,59 @@ Supports JWT, OAuth2, SSO, MFA, and role-based access control.
 
 from fastapi import FastAPI, HTTPException, Depends, status, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.responses import ORJSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, List, Dict, Any
-from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Set, Tuple
+from datetime import datetime, timedelta, timezone
 from uuid import UUID, uuid4
 from enum import Enum
+from dataclasses import dataclass
 import jwt
 import bcrypt
+import pyotp
+from argon2 import PasswordHasher, extract_parameters
+from argon2.low_level import ARGON2_VERSION
+from argon2.exceptions import VerificationError, InvalidHashError
 import structlog
+import redis.asyncio as aioredis
 import uvicorn
 import secrets
-
+import hashlib
+import hmac
+import base64
+import json
+import threading
+from urllib.parse import quote
+import functools
+import time
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache, TLRUCache
+
+
+
+def stringify_uuids(logger, method_name, event_dict):
+    """Render UUID values as plain strings, only for events that are emitted."""
+    for key, value in event_dict.items():
+        if isinstance(value, UUID):
+            event_dict[key] = str(value)
+    return event_dict
+
+
+# Configure logging; request-scoped fields come from contextvars bound per request
+structlog.configure(
+    processors=[
+        structlog.contextvars.merge_contextvars,
+        structlog.processors.add_log_level,
+        structlog.processors.TimeStamper(fmt="iso"),
+        stringify_uuids,
+        structlog.dev.ConsoleRenderer()
+    ]
+)
 logger = structlog.get_logger(__name__)
 
 # Configuration
@@ -26,6 +67,31 @@ SECRET_KEY = "your-secret-key-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
+REFRESH_TOKEN_TTL_SECONDS = REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60
+REDIS_URL = os.environ.get("AUTH_REDIS_URL")  # Unset keeps refresh tokens in process memory
+PASSWORD_CACHE_TTL_SECONDS = 60
+ARGON2_TIME_COST = 2
+ARGON2_MEMORY_COST_KIB = 64 * 1024  # Floor; startup calibration may raise it
+ARGON2_MAX_MEMORY_COST_KIB = 1024 * 1024
+ARGON2_MEMORY_BUDGET_KIB = 2 * 1024 * 1024  # Shared by every concurrent hash in the password pool
+ARGON2_TARGET_SECONDS = 0.25
+ARGON2_PARALLELISM = 2
+TOKEN_SWEEP_INTERVAL_SECONDS = 60
+TOKEN_CACHE_TTL_SECONDS = 60
+RATE_LIMIT_WINDOW_SECONDS = 60
+LOGIN_ATTEMPTS_PER_CLIENT = 5  # Per (client IP, email) per window
+LOGIN_ATTEMPTS_PER_EMAIL = 20  # Per registered account across all clients per window
+PASSWORD_RESETS_PER_CLIENT = 3  # Per client IP per window
+
+# Shared JWT codec and signing key prepared once for every encode/decode
+_jwt = jwt.PyJWT()
+SIGNING_KEY = jwt.PyJWS().get_algorithm_by_name(ALGORITHM).prepare_key(SECRET_KEY)
+
+# HS256 tokens are signed directly: fixed header segment plus a keyed HMAC template to copy
+JWT_HEADER_SEGMENT = base64.urlsafe_b64encode(
+    json.dumps({"alg": ALGORITHM, "typ": "JWT"}, separators=(",", ":")).encode()
+).rstrip(b"=")
+JWT_HMAC = hmac.new(SIGNING_KEY, digestmod=hashlib.sha256) if ALGORITHM == "HS256" else None
 
 
 # ============================================
@@ -84,6 +150,9 @@ class UserResponse(BaseModel):
     last_login: Optional[datetime]
 
 
+USER_RESPONSE_FIELDS = tuple(UserResponse.model_fields)
+
+
 class TokenResponse(BaseModel):
     access_token: str
     refresh_token: str
@@ -152,11 +221,70 @@ class RolePermissions(BaseModel):
 # IN-MEMORY STORAGE (Replace with database)
 # ============================================
 
-users_db: Dict[UUID, Dict] = {}
-sessions_db: Dict[UUID, Dict] = {}
+# Slotted records for stored users and sessions: fixed layout, attribute reads
+@dataclass(slots=True)
+class UserRecord:
+    id: UUID
+    email: str
+    password_hash: Optional[str]
+    full_name: str
+    role: UserRole
+    is_active: bool
+    is_verified: bool
+    provider: AuthProvider
+    avatar_url: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+    last_login: Optional[datetime]
+    mfa_enabled: bool
+
+
+@dataclass(slots=True)
+class SessionRecord:
+    id: UUID
+    user_id: UUID
+    token_hash: str
+    device_info: Dict[str, Any]
+    ip_address: str
+    created_at: datetime
+    expires_at: datetime
+    is_active: bool
+
+
+users_db: Dict[UUID, UserRecord] = {}
+email_index: Dict[str, UUID] = {}  # Lowercased email -> user id
+sessions_db: Dict[UUID, SessionRecord] = {}
 refresh_tokens_db: Dict[str, Dict] = {}
-password_reset_tokens: Dict[str, Dict] = {}
-mfa_secrets: Dict[UUID, str] = {}
+user_sessions: Dict[UUID, Set[UUID]] = {}  # User id -> session ids in sessions_db
+user_refresh_tokens: Dict[UUID, Set[str]] = {}  # User id -> tokens in refresh_tokens_db
+
+# Shared refresh-token store so every worker sees issuance and revocation;
+# keys are rt:{token} (hash, expiring) and user_rt:{user_id} (set of tokens)
+redis_client: Optional[aioredis.Redis] = aioredis.from_url(REDIS_URL) if REDIS_URL else None
+password_reset_tokens: Dict[bytes, Dict] = {}  # Keyed by sha256(token)
+mfa_totps: Dict[UUID, pyotp.TOTP] = {}  # Built once at setup; holds the user's secret
+totp_codes: Dict[UUID, Tuple[int, str]] = {}  # User id -> (time step, expected code)
+
+# Recent successful password checks, keyed by an HMAC under a per-process
+# pepper so cached keys are useless for offline guessing
+PASSWORD_CACHE_PEPPER = secrets.token_bytes(32)
+password_verify_cache: TTLCache = TTLCache(maxsize=10000, ttl=PASSWORD_CACHE_TTL_SECONDS)
+credential_epochs: Dict[UUID, int] = {}  # Bumped to drop a user's cached checks
+
+# Attempt counters keyed by (key, fixed window index); the TTL only reclaims
+# finished windows. Per-account counters are keyed by user id in their own
+# cache, so spraying unknown emails cannot evict them.
+login_attempts_by_client: TTLCache = TTLCache(maxsize=100000, ttl=RATE_LIMIT_WINDOW_SECONDS)
+login_attempts_by_user: TTLCache = TTLCache(maxsize=100000, ttl=RATE_LIMIT_WINDOW_SECONDS)
+password_reset_attempts: TTLCache = TTLCache(maxsize=100000, ttl=RATE_LIMIT_WINDOW_SECONDS)
+
+# Verified JWT payloads keyed by token_cache_key(token); each entry lives until the
+# sooner of TOKEN_CACHE_TTL_SECONDS or the token's own expiry
+decoded_token_cache: TLRUCache = TLRUCache(
+    maxsize=50000,
+    ttu=lambda _key, payload, now: min(now + TOKEN_CACHE_TTL_SECONDS, payload["exp"]),
+    timer=time.time,
+)
 
 # Default permissions per role
 ROLE_PERMISSIONS = {
@@ -178,19 +306,179 @@ ROLE_PERMISSIONS = {
     ]
 }
 
+# Precomputed lookups so permission checks are set probes
+ROLE_PERMISSION_SETS = {role: frozenset(perms) for role, perms in ROLE_PERMISSIONS.items()}
+ROLE_WILDCARDS = {
+    role: frozenset(p[:-2] for p in perms if p.endswith(":*"))
+    for role, perms in ROLE_PERMISSIONS.items()
+}
+ROLE_IS_ADMIN = {role: "*" in perms for role, perms in ROLE_PERMISSIONS.items()}
+
 
 # ============================================
 # HELPER FUNCTIONS
 # ============================================
 
-def hash_password(password: str) -> str:
-    """Hash a password using bcrypt."""
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+def utcnow() -> datetime:
+    """Current UTC time as a naive datetime, without the deprecated utcnow()."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
 
-def verify_password(password: str, hashed: str) -> bool:
+class EntropyPool:
+    """Hands out URL-safe tokens sliced from batched os.urandom reads."""
+
+    def __init__(self, token_bytes: int = 32, batch: int = 64):
+        self.token_bytes = token_bytes
+        self.batch = batch
+        self.buffer = b""
+        self.offset = 0
+        self.lock = threading.Lock()
+
+    def token_urlsafe(self) -> str:
+        """Return a token equivalent to secrets.token_urlsafe(token_bytes)."""
+        with self.lock:
+            if self.offset + self.token_bytes > len(self.buffer):
+                self.buffer = os.urandom(self.token_bytes * self.batch)
+                self.offset = 0
+            chunk = self.buffer[self.offset:self.offset + self.token_bytes]
+            self.offset += self.token_bytes
+        return base64.urlsafe_b64encode(chunk).rstrip(b"=").decode()
+
+
+# Reset tokens and OAuth state share one pool; each byte is handed out once
+token_pool = EntropyPool()
+
+
+# Password hashing gets its own threads so it neither blocks the event loop
+# nor competes with other work in the default executor. Each lifespan creates
+# and shuts down its own pool; outside one, hashes use the default executor.
+PASSWORD_POOL_WORKERS = os.cpu_count() or 1
+password_pool: Optional[ThreadPoolExecutor] = None
+
+password_hasher = PasswordHasher(
+    time_cost=ARGON2_TIME_COST,
+    memory_cost=ARGON2_MEMORY_COST_KIB,
+    parallelism=ARGON2_PARALLELISM,
+)
+
+
+def calibrate_password_hasher() -> PasswordHasher:
+    """Double argon2id memory from the floor until one hash takes ARGON2_TARGET_SECONDS.
+
+    Memory stays on the floor * 2**n ladder and is capped so that every pool
+    worker hashing at once fits in ARGON2_MEMORY_BUDGET_KIB.
+    """
+    max_memory_cost = max(
+        ARGON2_MEMORY_COST_KIB,
+        min(ARGON2_MAX_MEMORY_COST_KIB, ARGON2_MEMORY_BUDGET_KIB // PASSWORD_POOL_WORKERS),
+    )
+    memory_cost = ARGON2_MEMORY_COST_KIB
+    while True:
+        hasher = PasswordHasher(
+            time_cost=ARGON2_TIME_COST,
+            memory_cost=memory_cost,
+            parallelism=ARGON2_PARALLELISM,
+        )
+        started = time.perf_counter()
+        hasher.hash("calibration-password")
+        elapsed = time.perf_counter() - started
+        if elapsed >= ARGON2_TARGET_SECONDS or memory_cost * 2 > max_memory_cost:
+            return hasher
+        memory_cost *= 2
+
+
+def check_password_hash(password: str, hashed: str) -> bool:
+    """Check a password against an argon2id or legacy bcrypt hash."""
+    if not hashed.startswith("$argon2"):
+        return bcrypt.checkpw(password.encode(), hashed.encode())
+    try:
+        return password_hasher.verify(hashed, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def password_needs_rehash(hashed: str) -> bool:
+    """Whether a stored hash is bcrypt or uses outdated argon2 parameters."""
+    if not hashed.startswith("$argon2"):
+        return True
+    try:
+        stored = extract_parameters(hashed)
+    except InvalidHashError:
+        return True
+    # Calibration timing noise can move memory_cost one doubling between
+    # restarts; that alone is not worth re-hashing every user on next login
+    current = password_hasher
+    return (
+        stored.type != current.type
+        or stored.version != ARGON2_VERSION
+        or stored.time_cost != current.time_cost
+        or stored.parallelism != current.parallelism
+        or stored.hash_len != current.hash_len
+        or stored.salt_len != current.salt_len
+        or not current.memory_cost // 2 <= stored.memory_cost <= current.memory_cost * 2
+    )
+
+
+async def hash_password(password: str) -> str:
+    """Hash a password using argon2id."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_pool, password_hasher.hash, password)
+
+
+async def verify_password(password: str, hashed: str, user_id: UUID) -> bool:
     """Verify a password against a hash."""
-    return bcrypt.checkpw(password.encode(), hashed.encode())
+    # Only successes are cached; the hash and the user's credential epoch are
+    # part of the key, so a password change or revocation stops old entries matching
+    epoch = credential_epochs.get(user_id, 0)
+    key = hmac.new(
+        PASSWORD_CACHE_PEPPER, f"{user_id}\0{epoch}\0{hashed}\0{password}".encode(), hashlib.sha256
+    ).digest()
+    if key in password_verify_cache:
+        return True
+
+    loop = asyncio.get_running_loop()
+    verified = await loop.run_in_executor(password_pool, check_password_hash, password, hashed)
+    if verified:
+        password_verify_cache[key] = True
+    return verified
+
+
+def forget_verified_passwords(user_id: UUID) -> None:
+    """Invalidate every cached password check for a user."""
+    credential_epochs[user_id] = credential_epochs.get(user_id, 0) + 1
+
+
+def client_ip(request: Request) -> str:
+    """Best-effort client address for rate limiting."""
+    return request.client.host if request.client else "unknown"
+
+
+def rate_limit_window(key: Any) -> Tuple[Any, int]:
+    """Counter key for the current fixed RATE_LIMIT_WINDOW_SECONDS window."""
+    return key, int(time.time() // RATE_LIMIT_WINDOW_SECONDS)
+
+
+def enforce_rate_limit(counters: TTLCache, key: Any, limit: int) -> None:
+    """Count an attempt under key, rejecting it once the window's limit is reached."""
+    window_key = rate_limit_window(key)
+    attempts = counters.get(window_key, 0)
+    if attempts >= limit:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, try again later"
+        )
+    counters[window_key] = attempts + 1
+
+
+def clear_rate_limit(counters: TTLCache, key: Any) -> None:
+    """Forget the current window's attempts under key."""
+    counters.pop(rate_limit_window(key), None)
+
+
+@functools.lru_cache(maxsize=10000)
+def parse_user_id(sub: str) -> UUID:
+    """Parse a token subject into a user id, memoized per subject."""
+    return UUID(sub)
 
 
 def create_token(
@@ -201,25 +489,44 @@ def create_token(
     """Create a JWT token."""
     to_encode = data.copy()
 
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
+    # Integer epoch seconds are what PyJWT would emit for datetimes anyway
+    now = int(time.time())
+    lifetime = int(expires_delta.total_seconds()) if expires_delta else 15 * 60
 
     to_encode.update({
-        "exp": expire,
-        "iat": datetime.utcnow(),
+        "exp": now + lifetime,
+        "iat": now,
         "type": token_type.value,
         "jti": str(uuid4())
     })
 
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    if JWT_HMAC is None:
+        return _jwt.encode(to_encode, SIGNING_KEY, algorithm=ALGORITHM)
+
+    signing_input = JWT_HEADER_SEGMENT + b"." + base64.urlsafe_b64encode(
+        json.dumps(to_encode, separators=(",", ":")).encode()
+    ).rstrip(b"=")
+    signer = JWT_HMAC.copy()
+    signer.update(signing_input)
+    signature = base64.urlsafe_b64encode(signer.digest()).rstrip(b"=")
+    return (signing_input + b"." + signature).decode()
+
+
+def token_cache_key(token: str) -> bytes:
+    """Key a token in decoded_token_cache by a truncated sha256 digest."""
+    return hashlib.sha256(token.encode()).digest()[:16]
 
 
 def decode_token(token: str) -> Dict[str, Any]:
     """Decode and validate a JWT token."""
+    key = token_cache_key(token)
+    payload = decoded_token_cache.get(key)
+    if payload is not None:
+        return payload
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = _jwt.decode(token, SIGNING_KEY, algorithms=[ALGORITHM])
+        decoded_token_cache[key] = dict(payload)
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(
@@ -233,19 +540,142 @@ def decode_token(token: str) -> Dict[str, Any]:
         )
 
 
-def get_user_by_email(email: str) -> Optional[Dict]:
+def get_user_by_email(email: str) -> Optional[UserRecord]:
     """Get user by email."""
-    for user in users_db.values():
-        if user["email"] == email:
-            return user
-    return None
+    user_id = email_index.get(email.lower())
+    return users_db.get(user_id) if user_id else None
+
 
+def user_response(user: UserRecord) -> UserResponse:
+    """Build a UserResponse from a stored user without re-validating it."""
+    return UserResponse.model_construct(**{field: getattr(user, field) for field in USER_RESPONSE_FIELDS})
 
-def get_user_by_id(user_id: UUID) -> Optional[Dict]:
+
+def get_user_by_id(user_id: UUID) -> Optional[UserRecord]:
     """Get user by ID."""
     return users_db.get(user_id)
 
 
+def save_user(user: UserRecord) -> None:
+    """Store a user and keep the email index in step, replacing any old address."""
+    previous = users_db.get(user.id)
+    if previous is not None:
+        email_index.pop(previous.email.lower(), None)
+    users_db[user.id] = user
+    email_index[user.email.lower()] = user.id
+
+
+def save_session(session: SessionRecord) -> None:
+    """Store a session and index it under its user."""
+    sessions_db[session.id] = session
+    user_sessions.setdefault(session.user_id, set()).add(session.id)
+
+
+def start_session(user_id: UUID, refresh_token: str, request: Request, now: datetime) -> SessionRecord:
+    """Record a sign-in as a session tied to the refresh token it issued."""
+    session = SessionRecord(
+        id=uuid4(),
+        user_id=user_id,
+        token_hash=hashlib.sha256(refresh_token.encode()).hexdigest(),
+        device_info={"user_agent": request.headers.get("user-agent", "")},
+        ip_address=client_ip(request),
+        created_at=now,
+        expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+        is_active=True,
+    )
+    save_session(session)
+    return session
+
+
+def get_user_sessions(user_id: UUID) -> List[SessionRecord]:
+    """Get every stored session for a user."""
+    return [sessions_db[session_id] for session_id in user_sessions.get(user_id, ())]
+
+
+def deactivate_user_sessions(user_id: UUID) -> None:
+    """Mark every session of a user inactive, walking only that user's index entry."""
+    for session_id in user_sessions.get(user_id, ()):
+        sessions_db[session_id].is_active = False
+
+
+async def save_refresh_token(token: str, user_id: UUID, now: datetime) -> None:
+    """Store a refresh token and index it under its user."""
+    if redis_client is not None:
+        user_key = f"user_rt:{user_id}"
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(f"rt:{token}", mapping={"user_id": str(user_id), "created_at": now.isoformat()})
+            pipe.expire(f"rt:{token}", REFRESH_TOKEN_TTL_SECONDS)
+            pipe.sadd(user_key, token)
+            pipe.expire(user_key, REFRESH_TOKEN_TTL_SECONDS)
+            await pipe.execute()
+        return
+
+    refresh_tokens_db[token] = {
+        "user_id": user_id,
+        "created_at": now,
+        "expires_at": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    }
+    user_refresh_tokens.setdefault(user_id, set()).add(token)
+
+
+async def revoke_refresh_token(token: str) -> bool:
+    """Remove a refresh token and its index entry; True only for the caller that removed it."""
+    if redis_client is not None:
+        # Reading the owner and deleting the key in one MULTI makes the delete
+        # the existence check: of concurrent callers, only one sees deleted == 1
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hget(f"rt:{token}", "user_id")
+            pipe.delete(f"rt:{token}")
+            user_id, deleted = await pipe.execute()
+        if not deleted:
+            return False
+        await redis_client.srem(f"user_rt:{user_id.decode()}", token)
+        return True
+
+    data = refresh_tokens_db.pop(token, None)
+    if data is None:
+        return False
+    tokens = user_refresh_tokens.get(data["user_id"])
+    if tokens is not None:
+        tokens.discard(token)
+        if not tokens:
+            del user_refresh_tokens[data["user_id"]]
+    return True
+
+
+def sweep_expired_tokens() -> None:
+    """Drop expired in-memory refresh and password reset tokens in one pass."""
+    now = utcnow()
+    for token in [t for t, data in refresh_tokens_db.items() if data["expires_at"] < now]:
+        data = refresh_tokens_db.pop(token)
+        tokens = user_refresh_tokens.get(data["user_id"])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del user_refresh_tokens[data["user_id"]]
+    for key in [k for k, data in password_reset_tokens.items() if data["expires_at"] < now]:
+        del password_reset_tokens[key]
+
+
+async def sweep_tokens_forever() -> None:
+    """Run sweep_expired_tokens every TOKEN_SWEEP_INTERVAL_SECONDS."""
+    while True:
+        await asyncio.sleep(TOKEN_SWEEP_INTERVAL_SECONDS)
+        sweep_expired_tokens()
+
+
+async def revoke_user_refresh_tokens(user_id: UUID) -> None:
+    """Remove every refresh token issued to a user."""
+    if redis_client is not None:
+        user_key = f"user_rt:{user_id}"
+        tokens = await redis_client.smembers(user_key)
+        await redis_client.delete(user_key, *(f"rt:{token.decode()}" for token in tokens))
+        return
+
+    for token in user_refresh_tokens.pop(user_id, ()):
+        refresh_tokens_db.pop(token, None)
+
+
 # ============================================
 # OAUTH2 SETUP
 # ============================================
@@ -253,7 +683,7 @@ def get_user_by_id(user_id: UUID) -> Optional[Dict]:
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict:
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserRecord:
     """Get current authenticated user from token."""
     payload = decode_token(token)
 
@@ -263,7 +693,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict:
             detail="Invalid token type"
         )
 
-    user_id = UUID(payload.get("sub"))
+    user_id = parse_user_id(payload.get("sub"))
     user = get_user_by_id(user_id)
 
     if not user:
@@ -272,20 +702,21 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict:
             detail="User not found"
         )
 
-    if not user["is_active"]:
+    if not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User is inactive"
         )
 
+    structlog.contextvars.bind_contextvars(user_id=user_id)
     return user
 
 
 async def get_current_active_user(
-    current_user: Dict = Depends(get_current_user)
-) -> Dict:
+    current_user: UserRecord = Depends(get_current_user)
+) -> UserRecord:
     """Ensure user is active."""
-    if not current_user["is_active"]:
+    if not current_user.is_active:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Inactive user"
@@ -296,21 +727,22 @@ async def get_current_active_user(
 def require_permissions(required: List[str]):
     """Dependency to check user permissions."""
     async def permission_checker(
-        current_user: Dict = Depends(get_current_active_user)
-    ) -> Dict:
-        user_role = UserRole(current_user["role"])
-        user_permissions = ROLE_PERMISSIONS.get(user_role, [])
+        current_user: UserRecord = Depends(get_current_active_user)
+    ) -> UserRecord:
+        user_role = current_user.role
 
         # Admin has all permissions
-        if "*" in user_permissions:
+        if ROLE_IS_ADMIN.get(user_role, False):
             return current_user
 
+        user_permissions = ROLE_PERMISSION_SETS.get(user_role, frozenset())
+        wildcards = ROLE_WILDCARDS.get(user_role, frozenset())
+
         # Check each required permission
         for perm in required:
             if perm not in user_permissions:
                 # Check for wildcard permissions
-                resource = perm.split(":")[0]
-                if f"{resource}:*" not in user_permissions:
+                if perm.partition(":")[0] not in wildcards:
                     raise HTTPException(
                         status_code=status.HTTP_403_FORBIDDEN,
                         detail=f"Permission denied: {perm}"
@@ -325,10 +757,32 @@ def require_permissions(required: List[str]):
 # APPLICATION
 # ============================================
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application lifespan handler."""
+    global password_hasher, password_pool
+    pool = password_pool = ThreadPoolExecutor(max_workers=PASSWORD_POOL_WORKERS, thread_name_prefix="password")
+    loop = asyncio.get_running_loop()
+    password_hasher = await loop.run_in_executor(pool, calibrate_password_hasher)
+    logger.info("Password hasher calibrated", memory_cost_kib=password_hasher.memory_cost)
+    sweeper = asyncio.create_task(sweep_tokens_forever())
+
+    yield
+    sweeper.cancel()
+    # Let in-flight password hashes finish before the process exits
+    if password_pool is pool:
+        password_pool = None
+    pool.shutdown(wait=True)
+    if redis_client is not None:
+        await redis_client.aclose()
+
+
 app = FastAPI(
     title="AI-Suite Auth Service",
     description="Authentication and authorization service",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 app.add_middleware(
@@ -340,6 +794,26 @@ app.add_middleware(
 )
 
 
+class LogContextMiddleware:
+    """Start every HTTP request with a clean structlog context carrying a request_id.
+
+    Plain ASGI rather than @app.middleware("http"), which would add a
+    BaseHTTPMiddleware task and stream hop to every request.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            structlog.contextvars.clear_contextvars()
+            structlog.contextvars.bind_contextvars(request_id=uuid4())
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(LogContextMiddleware)
+
+
 # ============================================
 # ENDPOINTS
 # ============================================
@@ -361,61 +835,85 @@ async def register(user_data: UserCreate):
             detail="Email already registered"
         )
 
+    password_hash = await hash_password(user_data.password)
+
+    # Another registration may have claimed the email while hashing; re-check
+    # with no await between here and save_user
+    if get_user_by_email(user_data.email):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
+
     user_id = uuid4()
-    now = datetime.utcnow()
-
-    user = {
-        "id": user_id,
-        "email": user_data.email,
-        "password_hash": hash_password(user_data.password),
-        "full_name": user_data.full_name,
-        "role": user_data.role.value,
-        "is_active": True,
-        "is_verified": False,
-        "provider": AuthProvider.LOCAL.value,
-        "avatar_url": None,
-        "created_at": now,
-        "updated_at": now,
-        "last_login": None,
-        "mfa_enabled": False,
-    }
+    now = utcnow()
+
+    user = UserRecord(
+        id=user_id,
+        email=user_data.email,
+        password_hash=password_hash,
+        full_name=user_data.full_name,
+        role=user_data.role,
+        is_active=True,
+        is_verified=False,
+        provider=AuthProvider.LOCAL,
+        avatar_url=None,
+        created_at=now,
+        updated_at=now,
+        last_login=None,
+        mfa_enabled=False,
+    )
 
-    users_db[user_id] = user
-    logger.info("User registered", user_id=str(user_id), email=user_data.email)
+    save_user(user)
+    logger.info("User registered", user_id=user_id, email=user_data.email)
 
     # TODO: Send verification email
 
-    return UserResponse(**{
-        **user,
-        "role": UserRole(user["role"]),
-        "provider": AuthProvider(user["provider"])
-    })
+    return user_response(user)
 
 
 # ========== LOGIN ==========
 
 @app.post("/api/v1/auth/login", response_model=TokenResponse)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
     """Login with email and password."""
+    # Throttle before the password hash so floods cannot pin the hashing pool
+    client_key = (client_ip(request), form_data.username.lower())
+    enforce_rate_limit(login_attempts_by_client, client_key, LOGIN_ATTEMPTS_PER_CLIENT)
+
     user = get_user_by_email(form_data.username)
+    if user:
+        enforce_rate_limit(login_attempts_by_user, user.id, LOGIN_ATTEMPTS_PER_EMAIL)
+    verified_hash = user.password_hash if user else None
 
-    if not user or not verify_password(form_data.password, user["password_hash"]):
+    if not user or not await verify_password(form_data.password, verified_hash, user.id):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
         )
 
-    if not user["is_active"]:
+    if not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User account is disabled"
         )
 
+    # A successful sign-in should not count towards locking the account out
+    clear_rate_limit(login_attempts_by_client, client_key)
+    clear_rate_limit(login_attempts_by_user, user.id)
+
+    # Upgrade bcrypt and outdated argon2 hashes now that the password is known,
+    # unless a password change or reset replaced the hash while this one ran
+    if password_needs_rehash(verified_hash):
+        upgraded_hash = await hash_password(form_data.password)
+        if user.password_hash == verified_hash:
+            user.password_hash = upgraded_hash
+
     # Check MFA if enabled
-    if user.get("mfa_enabled"):
+    if user.mfa_enabled:
         # Return partial token for MFA verification
         mfa_token = create_token(
-            {"sub": str(user["id"]), "mfa_pending": True},
+            {"sub": str(user.id), "mfa_pending": True},
             TokenType.MFA,
             timedelta(minutes=5)
         )
@@ -429,38 +927,32 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
 
     # Create tokens
     access_token = create_token(
-        {"sub": str(user["id"]), "role": user["role"]},
+        {"sub": str(user.id), "role": user.role},
         TokenType.ACCESS,
         timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
 
     refresh_token = create_token(
-        {"sub": str(user["id"])},
+        {"sub": str(user.id)},
         TokenType.REFRESH,
         timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
     )
 
     # Store refresh token
-    refresh_tokens_db[refresh_token] = {
-        "user_id": user["id"],
-        "created_at": datetime.utcnow(),
-        "expires_at": datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    }
+    now = utcnow()
+    await save_refresh_token(refresh_token, user.id, now)
+    start_session(user.id, refresh_token, request, now)
 
     # Update last login
-    user["last_login"] = datetime.utcnow()
+    user.last_login = now
 
-    logger.info("User logged in", user_id=str(user["id"]))
+    logger.info("User logged in", user_id=user.id)
 
     return TokenResponse(
         access_token=access_token,
         refresh_token=refresh_token,
         expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
-        user=UserResponse(**{
-            **user,
-            "role": UserRole(user["role"]),
-            "provider": AuthProvider(user["provider"])
-        })
+        user=user_response(user)
     )
 
 
@@ -477,15 +969,16 @@ async def refresh_token(data: TokenRefresh):
             detail="Invalid token type"
         )
 
-    # Check if refresh token is valid
-    if data.refresh_token not in refresh_tokens_db:
+    # Revoking is the validity check, so a refresh token can be rotated only once
+    if not await revoke_refresh_token(data.refresh_token):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Refresh token not found or revoked"
         )
 
-    user_id = UUID(payload.get("sub"))
-    user = get_user_by_id(user_id)
+    # The subject string is reused verbatim for the new tokens; it is parsed only for the lookup
+    subject = payload.get("sub")
+    user = get_user_by_id(parse_user_id(subject))
 
     if not user:
         raise HTTPException(
@@ -495,35 +988,26 @@ async def refresh_token(data: TokenRefresh):
 
     # Create new access token
     access_token = create_token(
-        {"sub": str(user["id"]), "role": user["role"]},
+        {"sub": subject, "role": user.role},
         TokenType.ACCESS,
         timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
 
     # Optionally rotate refresh token
     new_refresh_token = create_token(
-        {"sub": str(user["id"])},
+        {"sub": subject},
         TokenType.REFRESH,
         timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
     )
 
-    # Remove old, add new refresh token
-    del refresh_tokens_db[data.refresh_token]
-    refresh_tokens_db[new_refresh_token] = {
-        "user_id": user["id"],
-        "created_at": datetime.utcnow(),
-        "expires_at": datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    }
+    # The old token was revoked above; store its replacement
+    await save_refresh_token(new_refresh_token, user.id, utcnow())
 
     return TokenResponse(
         access_token=access_token,
         refresh_token=new_refresh_token,
         expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
-        user=UserResponse(**{
-            **user,
-            "role": UserRole(user["role"]),
-            "provider": AuthProvider(user["provider"])
-        })
+        user=user_response(user)
     )
 
 
@@ -531,24 +1015,35 @@ async def refresh_token(data: TokenRefresh):
 
 @app.post("/api/v1/auth/logout")
 async def logout(
-    current_user: Dict = Depends(get_current_user),
-    refresh_token: Optional[str] = None
+    current_user: UserRecord = Depends(get_current_user),
+    refresh_token: Optional[str] = None,
+    access_token: str = Depends(oauth2_scheme)
 ):
     """Logout user and invalidate tokens."""
     # Remove refresh token if provided
-    if refresh_token and refresh_token in refresh_tokens_db:
-        del refresh_tokens_db[refresh_token]
+    if refresh_token:
+        await revoke_refresh_token(refresh_token)
+
+    # Drop the access token's cached payload rather than keep it warm
+    decoded_token_cache.pop(token_cache_key(access_token), None)
 
-    logger.info("User logged out", user_id=str(current_user["id"]))
+    logger.info("User logged out")
 
     return {"status": "logged_out"}
 
 
 # ========== PASSWORD RESET ==========
 
+def reset_token_digest(token: str) -> bytes:
+    """Digest a reset token so lookups never probe on the secret itself."""
+    return hashlib.sha256(token.encode()).digest()
+
+
 @app.post("/api/v1/auth/password/reset")
-async def request_password_reset(data: PasswordReset):
+async def request_password_reset(request: Request, data: PasswordReset):
     """Request password reset email."""
+    enforce_rate_limit(password_reset_attempts, client_ip(request), PASSWORD_RESETS_PER_CLIENT)
+
     user = get_user_by_email(data.email)
 
     # Always return success to prevent email enumeration
@@ -556,15 +1051,16 @@ async def request_password_reset(data: PasswordReset):
         return {"status": "reset_email_sent"}
 
     # Create reset token
-    reset_token = secrets.token_urlsafe(32)
-    password_reset_tokens[reset_token] = {
-        "user_id": user["id"],
-        "created_at": datetime.utcnow(),
-        "expires_at": datetime.utcnow() + timedelta(hours=1)
+    reset_token = token_pool.token_urlsafe()
+    now = utcnow()
+    password_reset_tokens[reset_token_digest(reset_token)] = {
+        "user_id": user.id,
+        "created_at": now,
+        "expires_at": now + timedelta(hours=1)
     }
 
     # TODO: Send reset email
-    logger.info("Password reset requested", user_id=str(user["id"]))
+    logger.info("Password reset requested", user_id=user.id)
 
     return {"status": "reset_email_sent", "token": reset_token}  # Remove token in production
 
@@ -572,7 +1068,9 @@ async def request_password_reset(data: PasswordReset):
 @app.post("/api/v1/auth/password/reset/confirm")
 async def confirm_password_reset(data: PasswordResetConfirm):
     """Confirm password reset with token."""
-    token_data = password_reset_tokens.get(data.token)
+    token_key = reset_token_digest(data.token)
+    # Claim the token before any await so it can only ever be used once
+    token_data = password_reset_tokens.pop(token_key, None)
 
     if not token_data:
         raise HTTPException(
@@ -580,8 +1078,8 @@ async def confirm_password_reset(data: PasswordResetConfirm):
             detail="Invalid or expired reset token"
         )
 
-    if datetime.utcnow() > token_data["expires_at"]:
-        del password_reset_tokens[data.token]
+    now = utcnow()
+    if now > token_data["expires_at"]:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Reset token has expired"
@@ -595,21 +1093,14 @@ async def confirm_password_reset(data: PasswordResetConfirm):
         )
 
     # Update password
-    user["password_hash"] = hash_password(data.new_password)
-    user["updated_at"] = datetime.utcnow()
-
-    # Remove used token
-    del password_reset_tokens[data.token]
+    user.password_hash = await hash_password(data.new_password)
+    forget_verified_passwords(user.id)
+    user.updated_at = now
 
     # Invalidate all refresh tokens for this user
-    tokens_to_remove = [
-        token for token, data in refresh_tokens_db.items()
-        if data["user_id"] == user["id"]
-    ]
-    for token in tokens_to_remove:
-        del refresh_tokens_db[token]
+    await revoke_user_refresh_tokens(user.id)
 
-    logger.info("Password reset completed", user_id=str(user["id"]))
+    logger.info("Password reset completed", user_id=user.id)
 
     return {"status": "password_reset_complete"}
 
@@ -617,19 +1108,20 @@ async def confirm_password_reset(data: PasswordResetConfirm):
 @app.post("/api/v1/auth/password/change")
 async def change_password(
     data: PasswordChange,
-    current_user: Dict = Depends(get_current_active_user)
+    current_user: UserRecord = Depends(get_current_active_user)
 ):
     """Change password for authenticated user."""
-    if not verify_password(data.current_password, current_user["password_hash"]):
+    if not await verify_password(data.current_password, current_user.password_hash, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Current password is incorrect"
         )
 
-    current_user["password_hash"] = hash_password(data.new_password)
-    current_user["updated_at"] = datetime.utcnow()
+    current_user.password_hash = await hash_password(data.new_password)
+    forget_verified_passwords(current_user.id)
+    current_user.updated_at = utcnow()
 
-    logger.info("Password changed", user_id=str(current_user["id"]))
+    logger.info("Password changed")
 
     return {"status": "password_changed"}
 
@@ -637,54 +1129,55 @@ async def change_password(
 # ========== USER PROFILE ==========
 
 @app.get("/api/v1/auth/me", response_model=UserResponse)
-async def get_me(current_user: Dict = Depends(get_current_active_user)):
+async def get_me(current_user: UserRecord = Depends(get_current_active_user)):
     """Get current user profile."""
-    return UserResponse(**{
-        **current_user,
-        "role": UserRole(current_user["role"]),
-        "provider": AuthProvider(current_user["provider"])
-    })
+    return user_response(current_user)
 
 
 @app.put("/api/v1/auth/me")
 async def update_me(
     full_name: Optional[str] = None,
     avatar_url: Optional[str] = None,
-    current_user: Dict = Depends(get_current_active_user)
+    current_user: UserRecord = Depends(get_current_active_user)
 ):
     """Update current user profile."""
     if full_name:
-        current_user["full_name"] = full_name
+        current_user.full_name = full_name
     if avatar_url:
-        current_user["avatar_url"] = avatar_url
+        current_user.avatar_url = avatar_url
 
-    current_user["updated_at"] = datetime.utcnow()
+    current_user.updated_at = utcnow()
 
-    return UserResponse(**{
-        **current_user,
-        "role": UserRole(current_user["role"]),
-        "provider": AuthProvider(current_user["provider"])
-    })
+    return user_response(current_user)
 
 
 # ========== MFA ==========
 
+def check_totp(user_id: UUID, totp: pyotp.TOTP, code: str) -> bool:
+    """Check a TOTP code, computing the expected code once per time step."""
+    step = int(time.time()) // totp.interval
+    cached = totp_codes.get(user_id)
+    if cached is None or cached[0] != step:
+        cached = (step, totp.generate_otp(step))
+        totp_codes[user_id] = cached
+    return hmac.compare_digest(code.encode(), cached[1].encode())
+
+
 @app.post("/api/v1/auth/mfa/setup")
 async def setup_mfa(
     data: MFASetup,
-    current_user: Dict = Depends(get_current_active_user)
+    current_user: UserRecord = Depends(get_current_active_user)
 ):
     """Setup MFA for user."""
-    import pyotp
-
     # Generate secret
     secret = pyotp.random_base32()
-    mfa_secrets[current_user["id"]] = secret
+    totp = pyotp.TOTP(secret)
+    mfa_totps[current_user.id] = totp
+    totp_codes.pop(current_user.id, None)
 
     # Generate provisioning URI for authenticator apps
-    totp = pyotp.TOTP(secret)
     provisioning_uri = totp.provisioning_uri(
-        name=current_user["email"],
+        name=current_user.email,
         issuer_name="AI-Suite"
     )
 
@@ -698,27 +1191,24 @@ async def setup_mfa(
 @app.post("/api/v1/auth/mfa/verify")
 async def verify_mfa(
     data: MFAVerify,
-    current_user: Dict = Depends(get_current_active_user)
+    current_user: UserRecord = Depends(get_current_active_user)
 ):
     """Verify MFA code and enable MFA."""
-    import pyotp
-
-    secret = mfa_secrets.get(current_user["id"])
-    if not secret:
+    totp = mfa_totps.get(current_user.id)
+    if not totp:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="MFA not setup"
         )
 
-    totp = pyotp.TOTP(secret)
-    if not totp.verify(data.code):
+    if not check_totp(current_user.id, totp, data.code):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid MFA code"
         )
 
-    current_user["mfa_enabled"] = True
-    current_user["updated_at"] = datetime.utcnow()
+    current_user.mfa_enabled = True
+    current_user.updated_at = utcnow()
 
     return {"status": "mfa_enabled"}
 
@@ -726,175 +1216,168 @@ async def verify_mfa(
 @app.post("/api/v1/auth/mfa/disable")
 async def disable_mfa(
     data: MFAVerify,
-    current_user: Dict = Depends(get_current_active_user)
+    current_user: UserRecord = Depends(get_current_active_user)
 ):
     """Disable MFA for user."""
-    import pyotp
-
-    secret = mfa_secrets.get(current_user["id"])
-    if not secret:
+    totp = mfa_totps.get(current_user.id)
+    if not totp:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="MFA not enabled"
         )
 
-    totp = pyotp.TOTP(secret)
-    if not totp.verify(data.code):
+    if not check_totp(current_user.id, totp, data.code):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid MFA code"
         )
 
-    current_user["mfa_enabled"] = False
-    del mfa_secrets[current_user["id"]]
+    current_user.mfa_enabled = False
+    del mfa_totps[current_user.id]
+    totp_codes.pop(current_user.id, None)
 
     return {"status": "mfa_disabled"}
 
 
 # ========== OAUTH ==========
 
+# OAuth configuration would come from environment
+OAUTH_CONFIGS = {
+    AuthProvider.GOOGLE: {
+        "auth_url": "https://accounts.google.com/o/oauth2/v2/auth",
+        "client_id": "your-google-client-id",
+        "scope": "openid email profile",
+    },
+    AuthProvider.MICROSOFT: {
+        "auth_url": "https://login.microsoftonline.com/common/oauth2/v2.0/authorize",
+        "client_id": "your-microsoft-client-id",
+        "scope": "openid email profile",
+    },
+    AuthProvider.GITHUB: {
+        "auth_url": "https://github.com/login/oauth/authorize",
+        "client_id": "your-github-client-id",
+        "scope": "user:email",
+    },
+}
+
+# Everything in the redirect URL but the state is fixed per provider
+OAUTH_URL_PREFIXES = {
+    provider: (
+        f"{config['auth_url']}?"
+        f"client_id={quote(config['client_id'], safe='')}&"
+        f"redirect_uri={quote(f'http://localhost:8000/api/v1/auth/oauth/{provider.value}/callback', safe='')}&"
+        f"scope={quote(config['scope'], safe='')}&"
+        f"response_type=code&"
+        f"state="
+    )
+    for provider, config in OAUTH_CONFIGS.items()
+}
+
+
 @app.get("/api/v1/auth/oauth/{provider}")
 async def oauth_redirect(provider: AuthProvider):
     """Get OAuth redirect URL for provider."""
-    # OAuth configuration would come from environment
-    oauth_configs = {
-        AuthProvider.GOOGLE: {
-            "auth_url": "https://accounts.google.com/o/oauth2/v2/auth",
-            "client_id": "your-google-client-id",
-            "scope": "openid email profile",
-        },
-        AuthProvider.MICROSOFT: {
-            "auth_url": "https://login.microsoftonline.com/common/oauth2/v2.0/authorize",
-            "client_id": "your-microsoft-client-id",
-            "scope": "openid email profile",
-        },
-        AuthProvider.GITHUB: {
-            "auth_url": "https://github.com/login/oauth/authorize",
-            "client_id": "your-github-client-id",
-            "scope": "user:email",
-        },
-    }
-
-    config = oauth_configs.get(provider)
-    if not config:
+    url_prefix = OAUTH_URL_PREFIXES.get(provider)
+    if not url_prefix:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Provider {provider} not supported"
         )
 
-    state = secrets.token_urlsafe(32)
-    redirect_uri = f"http://localhost:8000/api/v1/auth/oauth/{provider.value}/callback"
-
-    auth_url = (
-        f"{config['auth_url']}?"
-        f"client_id={config['client_id']}&"
-        f"redirect_uri={redirect_uri}&"
-        f"scope={config['scope']}&"
-        f"response_type=code&"
-        f"state={state}"
-    )
+    state = token_pool.token_urlsafe()
 
-    return {"auth_url": auth_url, "state": state}
+    return {"auth_url": url_prefix + state, "state": state}
 
 
 @app.post("/api/v1/auth/oauth/{provider}/callback")
-async def oauth_callback(provider: AuthProvider, data: OAuthCallback):
+async def oauth_callback(request: Request, provider: AuthProvider, data: OAuthCallback):
     """Handle OAuth callback."""
     # In production, exchange code for tokens and get user info
     # This is a simplified example
 
     # Create or get user
     user_id = uuid4()
-    now = datetime.utcnow()
-
-    user = {
-        "id": user_id,
-        "email": f"oauth-user-{user_id}@example.com",
-        "password_hash": None,
-        "full_name": "OAuth User",
-        "role": UserRole.USER.value,
-        "is_active": True,
-        "is_verified": True,
-        "provider": provider.value,
-        "avatar_url": None,
-        "created_at": now,
-        "updated_at": now,
-        "last_login": now,
-        "mfa_enabled": False,
-    }
+    now = utcnow()
+
+    user = UserRecord(
+        id=user_id,
+        email=f"oauth-user-{user_id}@example.com",
+        password_hash=None,
+        full_name="OAuth User",
+        role=UserRole.USER,
+        is_active=True,
+        is_verified=True,
+        provider=provider,
+        avatar_url=None,
+        created_at=now,
+        updated_at=now,
+        last_login=now,
+        mfa_enabled=False,
+    )
 
-    users_db[user_id] = user
+    save_user(user)
 
     # Create tokens
     access_token = create_token(
-        {"sub": str(user["id"]), "role": user["role"]},
+        {"sub": str(user.id), "role": user.role},
         TokenType.ACCESS,
         timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
 
     refresh_token = create_token(
-        {"sub": str(user["id"])},
+        {"sub": str(user.id)},
         TokenType.REFRESH,
         timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
     )
 
+    start_session(user.id, refresh_token, request, now)
+
     return TokenResponse(
         access_token=access_token,
         refresh_token=refresh_token,
         expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
-        user=UserResponse(**{
-            **user,
-            "role": UserRole(user["role"]),
-            "provider": AuthProvider(user["provider"])
-        })
+        user=user_response(user)
     )
 
 
 # ========== SESSIONS ==========
 
 @app.get("/api/v1/auth/sessions")
-async def get_sessions(current_user: Dict = Depends(get_current_active_user)):
+async def get_sessions(current_user: UserRecord = Depends(get_current_active_user)):
     """Get all active sessions for user."""
-    user_sessions = [
-        session for session in sessions_db.values()
-        if session["user_id"] == current_user["id"] and session["is_active"]
+    active_sessions = [
+        session for session in get_user_sessions(current_user.id)
+        if session.is_active
     ]
-    return {"sessions": user_sessions}
+    return {"sessions": active_sessions}
 
 
 @app.delete("/api/v1/auth/sessions/{session_id}")
 async def revoke_session(
     session_id: UUID,
-    current_user: Dict = Depends(get_current_active_user)
+    current_user: UserRecord = Depends(get_current_active_user)
 ):
     """Revoke a specific session."""
     session = sessions_db.get(session_id)
 
-    if not session or session["user_id"] != current_user["id"]:
+    if not session or session.user_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Session not found"
         )
 
-    session["is_active"] = False
+    session.is_active = False
 
     return {"status": "session_revoked"}
 
 
 @app.delete("/api/v1/auth/sessions")
-async def revoke_all_sessions(current_user: Dict = Depends(get_current_active_user)):
+async def revoke_all_sessions(current_user: UserRecord = Depends(get_current_active_user)):
     """Revoke all sessions for user."""
-    for session in sessions_db.values():
-        if session["user_id"] == current_user["id"]:
-            session["is_active"] = False
+    deactivate_user_sessions(current_user.id)
 
     # Also revoke all refresh tokens
-    tokens_to_remove = [
-        token for token, data in refresh_tokens_db.items()
-        if data["user_id"] == current_user["id"]
-    ]
-    for token in tokens_to_remove:
-        del refresh_tokens_db[token]
+    await revoke_user_refresh_tokens(current_user.id)
 
     return {"status": "all_sessions_revoked"}
 
@@ -903,26 +1386,23 @@ async def revoke_all_sessions(current_user: Dict = Depends(get_current_active_us
 
 @app.get("/api/v1/auth/users")
 async def list_users(
-    current_user: Dict = Depends(require_permissions(["users:read"]))
+    current_user: UserRecord = Depends(require_permissions(["users:read"]))
 ):
     """List all users (admin only)."""
-    return {
+    # Stored records already hold validated values; project them straight to orjson
+    return ORJSONResponse({
         "users": [
-            UserResponse(**{
-                **user,
-                "role": UserRole(user["role"]),
-                "provider": AuthProvider(user["provider"])
-            })
+            {field: getattr(user, field) for field in USER_RESPONSE_FIELDS}
             for user in users_db.values()
         ]
-    }
+    })
 
 
 @app.put("/api/v1/auth/users/{user_id}/role")
 async def update_user_role(
     user_id: UUID,
     role: UserRole,
-    current_user: Dict = Depends(require_permissions(["users:write"]))
+    current_user: UserRecord = Depends(require_permissions(["users:write"]))
 ):
     """Update user role (admin only)."""
     user = get_user_by_id(user_id)
@@ -933,8 +1413,8 @@ async def update_user_role(
             detail="User not found"
         )
 
-    user["role"] = role.value
-    user["updated_at"] = datetime.utcnow()
+    user.role = role
+    user.updated_at = utcnow()
 
     return {"status": "role_updated"}
 
@@ -943,7 +1423,7 @@ async def update_user_role(
 async def update_user_status(
     user_id: UUID,
     is_active: bool,
-    current_user: Dict = Depends(require_permissions(["users:write"]))
+    current_user: UserRecord = Depends(require_permissions(["users:write"]))
 ):
     """Enable/disable user (admin only)."""
     user = get_user_by_id(user_id)
@@ -954,14 +1434,14 @@ async def update_user_status(
             detail="User not found"
         )
 
-    user["is_active"] = is_active
-    user["updated_at"] = datetime.utcnow()
+    user.is_active = is_active
+    user.updated_at = utcnow()
 
     if not is_active:
+        forget_verified_passwords(user_id)
+
         # Revoke all sessions
-        for session in sessions_db.values():
-            if session["user_id"] == user_id:
-                session["is_active"] = False
+        deactivate_user_sessions(user_id)
 
     return {"status": "status_updated"}
 
@@ -969,9 +1449,9 @@ async def update_user_status(
 # ========== PERMISSIONS ==========
 
 @app.get("/api/v1/auth/permissions")
-async def get_permissions(current_user: Dict = Depends(get_current_active_user)):
+async def get_permissions(current_user: UserRecord = Depends(get_current_active_user)):
     """Get current user's permissions."""
-    user_role = UserRole(current_user["role"])
+    user_role = current_user.role
     permissions = ROLE_PERMISSIONS.get(user_role, [])
 
     return {
@@ -983,16 +1463,15 @@ async def get_permissions(current_user: Dict = Depends(get_current_active_user))
 @app.get("/api/v1/auth/permissions/check")
 async def check_permission(
     permission: str,
-    current_user: Dict = Depends(get_current_active_user)
+    current_user: UserRecord = Depends(get_current_active_user)
 ):
     """Check if user has a specific permission."""
-    user_role = UserRole(current_user["role"])
-    user_permissions = ROLE_PERMISSIONS.get(user_role, [])
+    user_role = current_user.role
 
     has_permission = (
-        "*" in user_permissions or
-        permission in user_permissions or
-        f"{permission.split(':')[0]}:*" in user_permissions
+        ROLE_IS_ADMIN.get(user_role, False) or
+        permission in ROLE_PERMISSION_SETS.get(user_role, frozenset()) or
+        permission.partition(":")[0] in ROLE_WILDCARDS.get(user_role, frozenset())
     )
 
     return {"permission": permission, "granted": has_permission}
@@ -12,17 +12,31 @@ Características:
 
 from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Iterator, Set
 from datetime import datetime, timedelta, date, time
 from enum import Enum
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict
+from functools import lru_cache
+from operator import itemgetter
+from cachetools import TTLCache
+import asyncio
+import heapq
+import itertools
+import random
 import uuid
-import json
+import orjson
+import structlog
+
+logger = structlog.get_logger(__name__)
 
 app = FastAPI(
     title="AI-Bookings Service",
     description="Sistema de Reservas con IA para AI-Suite",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 app.add_middleware(
@@ -77,8 +91,12 @@ class DayOfWeek(str, Enum):
 
 # ======================= MODELS =======================
 
+def new_id() -> str:
+    """Genera el identificador (UUID4) de un modelo nuevo"""
+    return str(uuid.uuid4())
+
 class Location(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     name: str
     address: str
     city: str
@@ -93,7 +111,7 @@ class Location(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Resource(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     name: str
     type: ResourceType
     location_id: str
@@ -114,12 +132,12 @@ class Resource(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Service(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     name: str
     description: Optional[str] = None
     category: str
     duration: int = 60  # minutes
-    price: float = 0
+    price: float = 0.0
     currency: str = "USD"
     resource_types: List[ResourceType] = []
     required_resources: int = 1
@@ -134,7 +152,7 @@ class Service(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Availability(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     resource_id: str
     day_of_week: DayOfWeek
     start_time: time
@@ -144,7 +162,7 @@ class Availability(BaseModel):
     valid_until: Optional[date] = None
 
 class BlockedTime(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     resource_id: str
     start_datetime: datetime
     end_datetime: datetime
@@ -156,7 +174,7 @@ class BlockedTime(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Customer(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     first_name: str
     last_name: str
     email: str
@@ -168,12 +186,17 @@ class Customer(BaseModel):
     total_bookings: int = 0
     no_shows: int = 0
     cancellations: int = 0
+    # Historial acumulado, actualizado en cada cambio de estado de sus reservas
+    completed_count: int = 0
+    cancelled_count: int = 0
+    total_spent: float = 0.0
+    last_visit: Optional[datetime] = None
     is_vip: bool = False
     is_blocked: bool = False
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Booking(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     booking_number: str
     customer_id: str
     service_id: Optional[str] = None
@@ -188,10 +211,10 @@ class Booking(BaseModel):
     notes: Optional[str] = None
     internal_notes: Optional[str] = None
     # Pricing
-    subtotal: float = 0
-    discount: float = 0
-    tax: float = 0
-    total: float = 0
+    subtotal: float = 0.0
+    discount: float = 0.0
+    tax: float = 0.0
+    total: float = 0.0
     currency: str = "USD"
     payment_status: PaymentStatus = PaymentStatus.NOT_REQUIRED
     payment_id: Optional[str] = None
@@ -216,7 +239,7 @@ class Booking(BaseModel):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 class BookingTemplate(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     name: str
     description: Optional[str] = None
     service_id: Optional[str] = None
@@ -228,7 +251,7 @@ class BookingTemplate(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class WaitlistEntry(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     customer_id: str
     service_id: Optional[str] = None
     resource_id: Optional[str] = None
@@ -241,7 +264,7 @@ class WaitlistEntry(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Review(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     booking_id: str
     customer_id: str
     rating: int  # 1-5
@@ -254,7 +277,7 @@ class Review(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Notification(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     booking_id: str
     type: str  # confirmation, reminder, cancellation, reschedule
     channel: str  # email, sms, push
@@ -279,7 +302,313 @@ reviews: Dict[str, Review] = {}
 notifications: Dict[str, Notification] = {}
 
 # WebSocket connections
-active_connections: Dict[str, List[WebSocket]] = {}
+active_connections: Dict[str, Set[WebSocket]] = {}
+
+# Tareas en segundo plano en curso; se guarda la referencia para que el GC no las cancele
+background_tasks: Set[asyncio.Task] = set()
+
+# ======================= ÍNDICES =======================
+
+# Estados que ocupan un recurso
+ACTIVE_BOOKING_STATUSES = frozenset({BookingStatus.PENDING, BookingStatus.CONFIRMED})
+
+class IntervalIndex:
+    """Intervalos [inicio, fin) ordenados por inicio, con búsqueda de solapes por bisect"""
+
+    __slots__ = ("starts", "entries", "max_span")
+
+    def __init__(self):
+        self.starts: List[datetime] = []
+        self.entries: List[Tuple[datetime, datetime, str]] = []
+        # Duración máxima vista: acota cuánto antes de la consulta puede empezar un solape
+        self.max_span = timedelta(0)
+
+    def add(self, start: datetime, end: datetime, key: str) -> None:
+        """Inserta un intervalo manteniendo el orden por inicio"""
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.entries.insert(i, (start, end, key))
+        if end - start > self.max_span:
+            self.max_span = end - start
+
+    def remove(self, start: datetime, end: datetime, key: str) -> None:
+        """Quita una aparición del intervalo; max_span se mantiene como cota superior"""
+        for i in range(bisect_left(self.starts, start), bisect_right(self.starts, start)):
+            if self.entries[i][2] == key and self.entries[i][1] == end:
+                del self.starts[i]
+                del self.entries[i]
+                return
+
+    def overlapping(self, start: datetime, end: datetime) -> List[Tuple[datetime, datetime, str]]:
+        """Intervalos (inicio, fin, clave) que solapan [start, end), ordenados por inicio"""
+        lo = bisect_left(self.starts, start - self.max_span)
+        hi = bisect_left(self.starts, end)
+        return [entry for entry in self.entries[lo:hi] if entry[1] > start]
+
+    def intersects_any(self, start: datetime, end: datetime, accept=None) -> bool:
+        """Indica si algún intervalo (aceptado por accept) solapa [start, end), parando en el primero"""
+        entries = self.entries
+        for i in range(bisect_left(self.starts, start - self.max_span), bisect_left(self.starts, end)):
+            _, entry_end, key = entries[i]
+            if entry_end > start and (accept is None or accept(key)):
+                return True
+        return False
+
+# Reservas y bloqueos de cada recurso. booking_index guarda todas las reservas (listados por recurso);
+# active_booking_index solo las que ocupan el recurso, para que las canceladas no alarguen los solapes
+booking_index: Dict[str, IntervalIndex] = defaultdict(IntervalIndex)
+active_booking_index: Dict[str, IntervalIndex] = defaultdict(IntervalIndex)
+blocked_index: Dict[str, IntervalIndex] = defaultdict(IntervalIndex)
+
+# Reservas por día de inicio, en orden de creación, y los días con reservas ordenados para acotar
+# un rango de fechas por bisect
+bookings_by_day: Dict[date, List[str]] = defaultdict(list)
+booking_days: List[date] = []
+
+# Reservas por ubicación y reservas hijas de cada recurrente, en orden de creación; reservas por estado
+bookings_by_location: Dict[str, List[str]] = defaultdict(list)
+bookings_by_parent: Dict[str, List[str]] = defaultdict(list)
+booking_status_counts: Counter = Counter()
+
+# Reseñas por recurso y por servicio de la reserva reseñada, en orden de alta
+reviews_by_resource: Dict[str, List[str]] = defaultdict(list)
+reviews_by_service: Dict[str, List[str]] = defaultdict(list)
+
+def save_review(review: Review) -> None:
+    """Guarda una reseña y la indexa por los recursos y el servicio de su reserva"""
+    reviews[review.id] = review
+    booking = bookings[review.booking_id]
+    for resource_id in dict.fromkeys(booking.resource_ids):
+        reviews_by_resource[resource_id].append(review.id)
+    if booking.service_id:
+        reviews_by_service[booking.service_id].append(review.id)
+
+# Entradas de waitlist que siguen en "waiting", en orden de alta
+waiting_entries: Dict[str, WaitlistEntry] = {}
+
+# Columnas paralelas ordenadas por created_at: ids y fechas de creación, para cortar "las recientes" por bisect
+created_booking_ids: List[str] = []
+booking_created_ats: List[datetime] = []
+
+# Franjas disponibles (is_available) por (recurso, día de la semana)
+availabilities_by_resource_day: Dict[Tuple[str, DayOfWeek], List[Availability]] = defaultdict(list)
+
+# Máscara por (recurso, día) con el bit m activo si el minuto m cae en alguna franja. Solo se construye
+# si las franjas empiezan y acaban en minuto exacto y ni se solapan ni se tocan: así estar dentro de la
+# unión equivale a estar dentro de una sola franja. None obliga a comprobar franja a franja
+availability_masks: Dict[Tuple[str, DayOfWeek], Optional[int]] = {}
+
+def minute_mask(start: int, end: int) -> int:
+    """Bits de los minutos [start, end) del día"""
+    return ((1 << (end - start)) - 1) << start
+
+def build_availability_mask(windows: List[Availability]) -> Optional[int]:
+    """Máscara por minutos de unas franjas, o None si no es equivalente a comprobarlas una a una"""
+    mask = 0
+    previous_end = -1
+    for avail in sorted(windows, key=lambda a: a.start_time):
+        if avail.start_time.second or avail.start_time.microsecond or avail.end_time.second or avail.end_time.microsecond:
+            return None
+        start = avail.start_time.hour * 60 + avail.start_time.minute
+        end = avail.end_time.hour * 60 + avail.end_time.minute
+        if start >= end or start <= previous_end:
+            return None
+        mask |= minute_mask(start, end)
+        previous_end = end
+    return mask
+
+def save_availability(avail: Availability) -> None:
+    """Guarda una franja de disponibilidad y la indexa por recurso y día"""
+    availabilities[avail.id] = avail
+    invalidate_availability()
+    if avail.is_available:
+        key = (avail.resource_id, avail.day_of_week)
+        availabilities_by_resource_day[key].append(avail)
+        availability_masks[key] = build_availability_mask(availabilities_by_resource_day[key])
+
+# Clientes por email (único) y texto de búsqueda en minúsculas de cada cliente. Los campos se
+# separan con NUL para que una búsqueda no case a caballo entre nombre, apellido y email
+customers_by_email: Dict[str, Customer] = {}
+customer_search_text: Dict[str, str] = {}
+
+def save_customer(customer: Customer) -> None:
+    """Guarda un cliente y lo indexa por email y texto de búsqueda"""
+    customers[customer.id] = customer
+    customers_by_email.setdefault(customer.email, customer)
+    customer_search_text[customer.id] = "\0".join((customer.first_name, customer.last_name, customer.email)).lower()
+
+# Reservas de cada cliente, en orden de creación
+bookings_by_customer: Dict[str, List[str]] = defaultdict(list)
+
+# Reservas de cada cliente ordenadas por inicio como (inicio, -orden de creación, id): recorrida al revés
+# da el orden por inicio descendente, con los empates en orden de creación
+customer_booking_starts: Dict[str, List[Tuple[datetime, int, str]]] = defaultdict(list)
+
+def any_conflict(
+    resource_id: str,
+    start_dt: datetime,
+    end_dt: datetime,
+    exclude_booking_id: Optional[str] = None
+) -> bool:
+    """Indica si alguna reserva activa del recurso solapa el intervalo"""
+    index = active_booking_index.get(resource_id)
+    if index is None:
+        return False
+    if exclude_booking_id is None:
+        return index.intersects_any(start_dt, end_dt)
+    return index.intersects_any(start_dt, end_dt, lambda booking_id: booking_id != exclude_booking_id)
+
+def busy_periods(resource_id: str, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+    """Periodos ocupados del recurso (bloqueos y reservas activas) en [start, end), fusionados y ordenados"""
+    periods = []
+    blocked = blocked_index.get(resource_id)
+    if blocked is not None:
+        periods.extend((s, e) for s, e, _ in blocked.overlapping(start, end) if s <= e)
+    index = active_booking_index.get(resource_id)
+    if index is not None:
+        periods.extend((s, e) for s, e, _ in index.overlapping(start, end) if s <= e)
+    periods.sort()
+
+    # Solo se fusionan solapes estrictos: dos periodos contiguos no ocupan el punto de unión
+    merged: List[Tuple[datetime, datetime]] = []
+    for s, e in periods:
+        if merged and s < merged[-1][1]:
+            if e > merged[-1][1]:
+                merged[-1] = (merged[-1][0], e)
+        else:
+            merged.append((s, e))
+    return merged
+
+def save_booking(booking: Booking) -> None:
+    """Guarda una reserva y la indexa en cada recurso"""
+    bookings[booking.id] = booking
+    invalidate_availability()
+    analytics_cache.clear()
+    day = booking.start_datetime.date()
+    if day not in bookings_by_day:
+        insort(booking_days, day)
+    bookings_by_day[day].append(booking.id)
+    bookings_by_location[booking.location_id].append(booking.id)
+    if booking.parent_booking_id:
+        bookings_by_parent[booking.parent_booking_id].append(booking.id)
+    booking_status_counts[booking.status] += 1
+    i = bisect_right(booking_created_ats, booking.created_at)
+    booking_created_ats.insert(i, booking.created_at)
+    created_booking_ids.insert(i, booking.id)
+    customer_booking_ids = bookings_by_customer[booking.customer_id]
+    customer_booking_ids.append(booking.id)
+    insort(customer_booking_starts[booking.customer_id], (booking.start_datetime, -len(customer_booking_ids), booking.id))
+    for resource_id in booking.resource_ids:
+        booking_index[resource_id].add(booking.start_datetime, booking.end_datetime, booking.id)
+        if booking.status in ACTIVE_BOOKING_STATUSES:
+            active_booking_index[resource_id].add(booking.start_datetime, booking.end_datetime, booking.id)
+
+def get_bookings_for_resource(resource_id: str) -> List[Booking]:
+    """Reservas que usan un recurso, ordenadas por inicio (empates en orden de creación)"""
+    index = booking_index.get(resource_id)
+    if index is None:
+        return []
+    # Una reserva que repite el recurso aparece varias veces en el índice
+    return [bookings[booking_id] for booking_id in dict.fromkeys(key for _, _, key in index.entries)]
+
+def get_bookings_for_customer(customer_id: str) -> List[Booking]:
+    """Reservas de un cliente sin recorrer las de los demás"""
+    return [bookings[booking_id] for booking_id in bookings_by_customer.get(customer_id, ())]
+
+def set_booking_status(booking: Booking, status: BookingStatus) -> None:
+    """Cambia el estado de una reserva y actualiza el historial acumulado del cliente"""
+    previous = booking.status
+    booking.status = status
+    if previous != status:
+        invalidate_availability()
+        analytics_cache.clear()
+        booking_status_counts[previous] -= 1
+        booking_status_counts[status] += 1
+
+    # Entra o sale de los intervalos que ocupan sus recursos
+    was_active = previous in ACTIVE_BOOKING_STATUSES
+    if was_active != (status in ACTIVE_BOOKING_STATUSES):
+        for resource_id in booking.resource_ids:
+            if was_active:
+                active_booking_index[resource_id].remove(booking.start_datetime, booking.end_datetime, booking.id)
+            else:
+                active_booking_index[resource_id].add(booking.start_datetime, booking.end_datetime, booking.id)
+    customer = customers.get(booking.customer_id)
+    if customer is None or previous == status:
+        return
+
+    if previous == BookingStatus.COMPLETED:
+        customer.completed_count -= 1
+        customer.total_spent -= booking.total
+        if customer.last_visit == booking.start_datetime:
+            customer.last_visit = max(
+                (b.start_datetime for b in get_bookings_for_customer(customer.id) if b.status == BookingStatus.COMPLETED),
+                default=None
+            )
+    elif previous == BookingStatus.CANCELLED:
+        customer.cancelled_count -= 1
+
+    if status == BookingStatus.COMPLETED:
+        customer.completed_count += 1
+        customer.total_spent += booking.total
+        if customer.last_visit is None or booking.start_datetime > customer.last_visit:
+            customer.last_visit = booking.start_datetime
+    elif status == BookingStatus.CANCELLED:
+        customer.cancelled_count += 1
+
+def bookings_between(start: Optional[date], end: Optional[date]) -> List[Booking]:
+    """Reservas que empiezan entre start y end (inclusive), por día y en orden de creación dentro del día"""
+    lo = 0 if start is None else bisect_left(booking_days, start)
+    hi = len(booking_days) if end is None else bisect_right(booking_days, end)
+    return [bookings[booking_id] for day in booking_days[lo:hi] for booking_id in bookings_by_day[day]]
+
+# ======================= CACHÉ =======================
+
+# Distingue "no cacheado" de un resultado None cacheado
+MISSING = object()
+
+# Listados de ubicaciones, recursos y servicios por (endpoint, filtros); se vacía al crear cualquiera de ellos
+catalog_cache: TTLCache = TTLCache(maxsize=1_000, ttl=60)
+
+# Respuestas de disponibilidad por (endpoint, parámetros); se vacía con cualquier cambio de reservas,
+# bloqueos, horarios o recursos, así que el TTL solo acota cuánto vive una consulta que no se repite
+availability_cache: TTLCache = TTLCache(maxsize=1_000, ttl=15)
+
+# Pronósticos e insights por parámetros. Los insights se vacían con cada alta o cambio de estado de una
+# reserva; el TTL acota cuánto tarda en salir de la ventana una reserva antigua
+analytics_cache: TTLCache = TTLCache(maxsize=256, ttl=60)
+
+# Cuántas veces se ha vaciado availability_cache; una respuesta en streaming solo se cachea si no cambió
+# desde que el handler empezó a leer la ocupación
+availability_epoch = 0
+
+def invalidate_availability() -> None:
+    """Descarta las respuestas de disponibilidad cacheadas tras un cambio de ocupación u horario"""
+    global availability_epoch
+    availability_epoch += 1
+    availability_cache.clear()
+
+def stream_availability(
+    head: Dict[str, Any], days: Iterator[Dict[str, Any]], cache_key: Tuple, epoch: int
+) -> StreamingResponse:
+    """Envía {**head, "availability": [...]} serializando día a día con orjson y cachea el cuerpo al terminar.
+
+    epoch es availability_epoch leído en el handler antes de calcular la ocupación: el cuerpo se
+    genera después de que el handler retorna, y si entretanto hubo una escritura no se cachea.
+    """
+    async def body():
+        chunks = [orjson.dumps(head)[:-1] + b',"availability":[']
+        yield chunks[0]
+        for i, day in enumerate(days):
+            chunk = orjson.dumps(day) if i == 0 else b"," + orjson.dumps(day)
+            chunks.append(chunk)
+            yield chunk
+        chunks.append(b"]}")
+        yield chunks[-1]
+        if epoch == availability_epoch:
+            availability_cache[cache_key] = b"".join(chunks)
+
+    return StreamingResponse(body(), media_type="application/json")
 
 # ======================= REQUEST MODELS =======================
 
@@ -309,7 +638,7 @@ class ServiceCreate(BaseModel):
     description: Optional[str] = None
     category: str
     duration: int = 60
-    price: float = 0
+    price: float = 0.0
     resource_types: List[ResourceType] = []
     max_participants: int = 1
 
@@ -343,16 +672,30 @@ class AvailabilitySlot(BaseModel):
 
 # ======================= HELPER FUNCTIONS =======================
 
+def list_response(items: List[BaseModel]) -> ORJSONResponse:
+    """Serializa modelos ya validados en memoria sin revalidarlos contra el response_model"""
+    return ORJSONResponse([item.model_dump() for item in items])
+
+# Contador de reservas de cada día (YYYYMMDD); con varios workers habría que moverlo a un INCR de Redis
+booking_sequence: Dict[str, itertools.count] = {}
+
 def generate_booking_number() -> str:
-    """Genera número único de reserva"""
-    import random
-    return f"BK{datetime.utcnow().strftime('%Y%m%d')}{random.randint(1000, 9999)}"
+    """Genera número único de reserva: fecha + secuencia diaria"""
+    day = datetime.utcnow().strftime('%Y%m%d')
+    return f"BK{day}{next(booking_sequence.setdefault(day, itertools.count(1))):06d}"
+
+# Día de la semana indexado por weekday() (lunes = 0)
+WEEKDAYS: Tuple[DayOfWeek, ...] = (
+    DayOfWeek.MONDAY, DayOfWeek.TUESDAY, DayOfWeek.WEDNESDAY,
+    DayOfWeek.THURSDAY, DayOfWeek.FRIDAY, DayOfWeek.SATURDAY, DayOfWeek.SUNDAY
+)
+
+# Demanda base por weekday() para el pronóstico
+BASE_DEMAND: Tuple[float, ...] = (0.7, 0.85, 0.9, 0.85, 0.75, 0.6, 0.4)
 
 def get_day_of_week(dt: datetime) -> DayOfWeek:
     """Obtiene día de la semana"""
-    days = [DayOfWeek.MONDAY, DayOfWeek.TUESDAY, DayOfWeek.WEDNESDAY,
-            DayOfWeek.THURSDAY, DayOfWeek.FRIDAY, DayOfWeek.SATURDAY, DayOfWeek.SUNDAY]
-    return days[dt.weekday()]
+    return WEEKDAYS[dt.weekday()]
 
 def check_resource_availability(
     resource_id: str,
@@ -370,49 +713,36 @@ def check_resource_availability(
 
     # Verificar horario de disponibilidad
     day = get_day_of_week(start_dt)
-    resource_avail = [a for a in availabilities.values()
-                      if a.resource_id == resource_id and a.day_of_week == day and a.is_available]
+    resource_avail = availabilities_by_resource_day.get((resource_id, day))
 
     if resource_avail:
         # Verificar que esté dentro del horario
         start_time = start_dt.time()
         end_time = end_dt.time()
-        in_schedule = any(a.start_time <= start_time and end_time <= a.end_time for a in resource_avail)
+        mask = availability_masks.get((resource_id, day))
+        start_minute = start_time.hour * 60 + start_time.minute
+        end_minute = end_time.hour * 60 + end_time.minute
+        if (mask is not None and start_minute < end_minute and
+                not (start_time.second or start_time.microsecond or end_time.second or end_time.microsecond)):
+            # Todos los minutos pedidos deben estar en la máscara
+            in_schedule = not (minute_mask(start_minute, end_minute) & ~mask)
+        else:
+            in_schedule = any(a.start_time <= start_time and end_time <= a.end_time for a in resource_avail)
         if not in_schedule:
             return False
 
     # Verificar bloqueos
-    for blocked in blocked_times.values():
-        if blocked.resource_id == resource_id:
-            if start_dt < blocked.end_datetime and end_dt > blocked.start_datetime:
-                return False
+    blocked = blocked_index.get(resource_id)
+    if blocked is not None and blocked.intersects_any(start_dt, end_dt):
+        return False
 
     # Verificar otras reservas
-    for booking in bookings.values():
-        if booking.id == exclude_booking_id:
-            continue
-        if resource_id in booking.resource_ids and booking.status in [BookingStatus.PENDING, BookingStatus.CONFIRMED]:
-            if start_dt < booking.end_datetime and end_dt > booking.start_datetime:
-                return False
-
-    return True
-
-def get_available_slots(
-    resource_id: str,
-    target_date: date,
-    duration_minutes: int,
-    slot_interval: int = 30
-) -> List[Dict[str, Any]]:
-    """Obtiene slots disponibles para un recurso"""
-    if resource_id not in resources:
-        return []
+    return not any_conflict(resource_id, start_dt, end_dt, exclude_booking_id)
 
-    resource = resources[resource_id]
-    day = get_day_of_week(datetime.combine(target_date, time(0, 0)))
-
-    # Obtener horario del día
-    day_avail = [a for a in availabilities.values()
-                 if a.resource_id == resource_id and a.day_of_week == day and a.is_available]
+def get_day_windows(resource_id: str, target_date: date) -> List[Availability]:
+    """Franjas disponibles del recurso para un día (por defecto 9:00-18:00)"""
+    day = WEEKDAYS[target_date.weekday()]
+    day_avail = availabilities_by_resource_day.get((resource_id, day))
 
     if not day_avail:
         # Default: 9am - 6pm
@@ -422,29 +752,69 @@ def get_available_slots(
             start_time=time(9, 0),
             end_time=time(18, 0)
         )]
+    return day_avail
+
+def iter_day_slots(
+    target_date: date,
+    windows: List[Availability],
+    duration_minutes: int,
+    slot_interval: int,
+    busy: List[Tuple[datetime, datetime]]
+):
+    """Recorre los slots de cada franja del día con un barrido sobre los periodos ocupados"""
+    duration = timedelta(minutes=duration_minutes)
+    step = timedelta(minutes=slot_interval)
+    busy_count = len(busy)
 
-    slots = []
-    for avail in day_avail:
+    for avail in windows:
         current = datetime.combine(target_date, avail.start_time)
         end_of_day = datetime.combine(target_date, avail.end_time)
+        # Primer periodo que termina después del inicio de la franja
+        i = bisect_right(busy, current, key=itemgetter(1))
 
-        while current + timedelta(minutes=duration_minutes) <= end_of_day:
-            slot_end = current + timedelta(minutes=duration_minutes)
-            is_available = check_resource_availability(resource_id, current, slot_end)
+        while current + duration <= end_of_day:
+            slot_end = current + duration
+            while i < busy_count and busy[i][1] <= current:
+                i += 1
+            yield current, slot_end, i == busy_count or busy[i][0] >= slot_end
+            current += step
 
-            slots.append({
-                "start": current.isoformat(),
-                "end": slot_end.isoformat(),
-                "is_available": is_available
-            })
-
-            current += timedelta(minutes=slot_interval)
+def get_available_slots(
+    resource_id: str,
+    target_date: date,
+    duration_minutes: int,
+    slot_interval: int = 30,
+    busy: Optional[List[Tuple[datetime, datetime]]] = None
+) -> List[Dict[str, Any]]:
+    """Obtiene slots disponibles para un recurso (busy: periodos ocupados ya calculados que cubren el día).
+    Las horas se devuelven como datetime; orjson las serializa en ISO 8601"""
+    if resource_id not in resources:
+        return []
 
-    return slots
+    # Obtener horario del día
+    day_avail = get_day_windows(resource_id, target_date)
+    if busy is None:
+        day_start = datetime.combine(target_date, time.min)
+        busy = busy_periods(resource_id, day_start, day_start + timedelta(days=1))
+    is_active = resources[resource_id].is_active
+
+    return [
+        {
+            "start": slot_start,
+            "end": slot_end,
+            "is_available": is_active and is_available
+        }
+        for slot_start, slot_end, is_available in iter_day_slots(
+            target_date, day_avail, duration_minutes, slot_interval, busy
+        )
+    ]
 
-def calculate_booking_price(service: Optional[Service], resource: Optional[Resource], duration_minutes: int) -> Dict[str, float]:
-    """Calcula precio de reserva"""
-    subtotal = 0
+@lru_cache(maxsize=4096)
+def calculate_booking_price(service_id: Optional[str], resource_id: Optional[str], duration_minutes: int) -> Dict[str, float]:
+    """Calcula precio de reserva (memoizado: servicios y recursos no cambian de tarifa; no modificar el resultado)"""
+    service = services.get(service_id) if service_id else None
+    resource = resources.get(resource_id) if resource_id else None
+    subtotal = 0.0
 
     if service and service.price > 0:
         subtotal = service.price
@@ -465,10 +835,15 @@ def find_optimal_slot(
     preferred_datetime: datetime,
     flexibility_hours: int = 4
 ) -> Optional[Dict[str, Any]]:
-    """Encuentra slot óptimo con IA"""
+    """Encuentra slot óptimo con IA (memoizado en availability_cache hasta el próximo cambio de ocupación)"""
     if service_id not in services:
         return None
 
+    cache_key = ("optimal", service_id, preferred_datetime, flexibility_hours)
+    cached = availability_cache.get(cache_key, MISSING)
+    if cached is not MISSING:
+        return cached
+
     service = services[service_id]
 
     # Buscar recursos compatibles
@@ -482,27 +857,33 @@ def find_optimal_slot(
     search_start = preferred_datetime - timedelta(hours=flexibility_hours)
     search_end = preferred_datetime + timedelta(hours=flexibility_hours)
 
-    best_slot = None
-    min_distance = float('inf')
-
+    # Horas candidatas (cada 30 min) de la más cercana a la preferida a la más lejana; en empate,
+    # la más temprana. Así el primer hueco libre es el óptimo y se deja de buscar
+    candidates = []
     current = search_start
     while current <= search_end:
-        for resource in compatible_resources:
-            slot_end = current + timedelta(minutes=service.duration)
-            if check_resource_availability(resource.id, current, slot_end):
-                distance = abs((current - preferred_datetime).total_seconds())
-                if distance < min_distance:
-                    min_distance = distance
-                    best_slot = {
-                        "resource_id": resource.id,
-                        "resource_name": resource.name,
-                        "start": current.isoformat(),
-                        "end": slot_end.isoformat(),
-                        "distance_minutes": distance / 60
-                    }
-
+        candidates.append(current)
         current += timedelta(minutes=30)
+    candidates.sort(key=lambda t: (abs(t - preferred_datetime), t))
+
+    best_slot = None
+    duration = timedelta(minutes=service.duration)
+    for current in candidates:
+        slot_end = current + duration
+        resource = next(
+            (r for r in compatible_resources if check_resource_availability(r.id, current, slot_end)), None
+        )
+        if resource is not None:
+            best_slot = {
+                "resource_id": resource.id,
+                "resource_name": resource.name,
+                "start": current.isoformat(),
+                "end": slot_end.isoformat(),
+                "distance_minutes": abs((current - preferred_datetime).total_seconds()) / 60
+            }
+            break
 
+    availability_cache[cache_key] = best_slot
     return best_slot
 
 # ======================= LOCATION ENDPOINTS =======================
@@ -510,8 +891,9 @@ def find_optimal_slot(
 @app.post("/locations", response_model=Location)
 async def create_location(data: LocationCreate):
     """Crear ubicación"""
-    location = Location(**data.model_dump())
+    location = Location.model_construct(**data.__dict__)
     locations[location.id] = location
+    catalog_cache.clear()
     return location
 
 @app.get("/locations", response_model=List[Location])
@@ -520,12 +902,19 @@ async def list_locations(
     is_active: bool = True
 ):
     """Listar ubicaciones"""
+    cache_key = ("locations", city, is_active)
+    cached = catalog_cache.get(cache_key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
     result = list(locations.values())
     if city:
         result = [l for l in result if l.city.lower() == city.lower()]
     if is_active is not None:
         result = [l for l in result if l.is_active == is_active]
-    return result
+    response = list_response(result)
+    catalog_cache[cache_key] = response.body
+    return response
 
 @app.get("/locations/{location_id}", response_model=Location)
 async def get_location(location_id: str):
@@ -537,7 +926,7 @@ async def get_location(location_id: str):
 @app.get("/locations/{location_id}/resources", response_model=List[Resource])
 async def get_location_resources(location_id: str):
     """Obtener recursos de ubicación"""
-    return [r for r in resources.values() if r.location_id == location_id and r.is_active]
+    return list_response([r for r in resources.values() if r.location_id == location_id and r.is_active])
 
 # ======================= RESOURCE ENDPOINTS =======================
 
@@ -547,19 +936,19 @@ async def create_resource(data: ResourceCreate):
     if data.location_id not in locations:
         raise HTTPException(status_code=404, detail="Location not found")
 
-    resource = Resource(**data.model_dump())
+    resource = Resource.model_construct(**data.__dict__)
     resources[resource.id] = resource
+    catalog_cache.clear()
 
     # Crear disponibilidad por defecto (Lunes a Viernes, 9-18)
-    for day in [DayOfWeek.MONDAY, DayOfWeek.TUESDAY, DayOfWeek.WEDNESDAY,
-                DayOfWeek.THURSDAY, DayOfWeek.FRIDAY]:
+    for day in WEEKDAYS[:5]:
         avail = Availability(
             resource_id=resource.id,
             day_of_week=day,
             start_time=time(9, 0),
             end_time=time(18, 0)
         )
-        availabilities[avail.id] = avail
+        save_availability(avail)
 
     return resource
 
@@ -570,6 +959,11 @@ async def list_resources(
     is_active: bool = True
 ):
     """Listar recursos"""
+    cache_key = ("resources", location_id, type, is_active)
+    cached = catalog_cache.get(cache_key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
     result = list(resources.values())
     if location_id:
         result = [r for r in result if r.location_id == location_id]
@@ -577,7 +971,9 @@ async def list_resources(
         result = [r for r in result if r.type == type]
     if is_active is not None:
         result = [r for r in result if r.is_active == is_active]
-    return result
+    response = list_response(result)
+    catalog_cache[cache_key] = response.body
+    return response
 
 @app.get("/resources/{resource_id}", response_model=Resource)
 async def get_resource(resource_id: str):
@@ -597,23 +993,31 @@ async def get_resource_availability(
     if resource_id not in resources:
         raise HTTPException(status_code=404, detail="Resource not found")
 
+    cache_key = ("resource", resource_id, start_date, end_date, duration_minutes)
+    cached = availability_cache.get(cache_key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
     end = end_date or start_date + timedelta(days=7)
-    all_slots = []
-    current_date = start_date
-
-    while current_date <= end:
-        day_slots = get_available_slots(resource_id, current_date, duration_minutes)
-        all_slots.append({
-            "date": current_date.isoformat(),
-            "slots": day_slots
-        })
-        current_date += timedelta(days=1)
+    epoch = availability_epoch
 
-    return {
-        "resource_id": resource_id,
-        "duration_minutes": duration_minutes,
-        "availability": all_slots
-    }
+    # Periodos ocupados de todo el rango, obtenidos una sola vez
+    busy = busy_periods(
+        resource_id, datetime.combine(start_date, time.min), datetime.combine(end + timedelta(days=1), time.min)
+    )
+
+    def days():
+        current_date = start_date
+        while current_date <= end:
+            yield {
+                "date": current_date.isoformat(),
+                "slots": get_available_slots(resource_id, current_date, duration_minutes, busy=busy)
+            }
+            current_date += timedelta(days=1)
+
+    return stream_availability(
+        {"resource_id": resource_id, "duration_minutes": duration_minutes}, days(), cache_key, epoch
+    )
 
 @app.put("/resources/{resource_id}/availability")
 async def set_resource_availability(
@@ -628,6 +1032,10 @@ async def set_resource_availability(
     to_delete = [a.id for a in availabilities.values() if a.resource_id == resource_id]
     for aid in to_delete:
         del availabilities[aid]
+    invalidate_availability()
+    for day in DayOfWeek:
+        availabilities_by_resource_day.pop((resource_id, day), None)
+        availability_masks.pop((resource_id, day), None)
 
     # Crear nueva disponibilidad
     for slot in schedule:
@@ -638,7 +1046,7 @@ async def set_resource_availability(
             end_time=time.fromisoformat(slot["end"]),
             is_available=slot.get("is_available", True)
         )
-        availabilities[avail.id] = avail
+        save_availability(avail)
 
     return {"message": "Availability updated", "slots": len(schedule)}
 
@@ -662,6 +1070,8 @@ async def block_resource_time(
         created_by=created_by
     )
     blocked_times[blocked.id] = blocked
+    blocked_index[resource_id].add(start_datetime, end_datetime, blocked.id)
+    invalidate_availability()
 
     return blocked
 
@@ -670,8 +1080,9 @@ async def block_resource_time(
 @app.post("/services", response_model=Service)
 async def create_service(data: ServiceCreate):
     """Crear servicio"""
-    service = Service(**data.model_dump())
+    service = Service.model_construct(**data.__dict__)
     services[service.id] = service
+    catalog_cache.clear()
     return service
 
 @app.get("/services", response_model=List[Service])
@@ -680,12 +1091,19 @@ async def list_services(
     is_active: bool = True
 ):
     """Listar servicios"""
+    cache_key = ("services", category, is_active)
+    cached = catalog_cache.get(cache_key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
     result = list(services.values())
     if category:
         result = [s for s in result if s.category == category]
     if is_active is not None:
         result = [s for s in result if s.is_active == is_active]
-    return result
+    response = list_response(result)
+    catalog_cache[cache_key] = response.body
+    return response
 
 @app.get("/services/{service_id}", response_model=Service)
 async def get_service(service_id: str):
@@ -705,8 +1123,14 @@ async def get_service_availability(
     if service_id not in services:
         raise HTTPException(status_code=404, detail="Service not found")
 
+    cache_key = ("service", service_id, location_id, start_date, end_date)
+    cached = availability_cache.get(cache_key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
     service = services[service_id]
     end = end_date or start_date + timedelta(days=7)
+    epoch = availability_epoch
 
     # Obtener recursos compatibles en ubicación
     compatible_resources = [r for r in resources.values()
@@ -714,42 +1138,45 @@ async def get_service_availability(
                            r.type in service.resource_types and
                            r.is_active]
 
-    availability = []
-    current_date = start_date
-
-    while current_date <= end:
-        day_slots = []
-        for resource in compatible_resources:
-            slots = get_available_slots(resource.id, current_date, service.duration)
-            available_slots = [s for s in slots if s["is_available"]]
-            if available_slots:
-                day_slots.extend([{
-                    **s,
-                    "resource_id": resource.id,
-                    "resource_name": resource.name
-                } for s in available_slots])
-
-        # Eliminar duplicados por hora
-        unique_starts = set()
-        unique_slots = []
-        for slot in day_slots:
-            if slot["start"] not in unique_starts:
-                unique_starts.add(slot["start"])
-                unique_slots.append(slot)
-
-        availability.append({
-            "date": current_date.isoformat(),
-            "available_slots": len(unique_slots),
-            "slots": sorted(unique_slots, key=lambda x: x["start"])
-        })
-        current_date += timedelta(days=1)
-
-    return {
-        "service_id": service_id,
-        "location_id": location_id,
-        "duration_minutes": service.duration,
-        "availability": availability
-    }
+    # Periodos ocupados de cada recurso en todo el rango, obtenidos una sola vez
+    range_start = datetime.combine(start_date, time.min)
+    range_end = datetime.combine(end + timedelta(days=1), time.min)
+    busy_by_resource = {r.id: busy_periods(r.id, range_start, range_end) for r in compatible_resources}
+
+    def days():
+        current_date = start_date
+        while current_date <= end:
+            # Primer recurso libre para cada hora de inicio
+            slots_by_start: Dict[datetime, Dict[str, Any]] = {}
+            for resource in compatible_resources:
+                windows = get_day_windows(resource.id, current_date)
+                for slot_start, slot_end, is_available in iter_day_slots(
+                    current_date, windows, service.duration, 30, busy_by_resource[resource.id]
+                ):
+                    if not is_available:
+                        continue
+                    if slot_start not in slots_by_start:
+                        slots_by_start[slot_start] = {
+                            "start": slot_start,
+                            "end": slot_end,
+                            "is_available": True,
+                            "resource_id": resource.id,
+                            "resource_name": resource.name
+                        }
+
+            yield {
+                "date": current_date.isoformat(),
+                "available_slots": len(slots_by_start),
+                "slots": sorted(slots_by_start.values(), key=lambda x: x["start"])
+            }
+            current_date += timedelta(days=1)
+
+    return stream_availability(
+        {"service_id": service_id, "location_id": location_id, "duration_minutes": service.duration},
+        days(),
+        cache_key,
+        epoch
+    )
 
 # ======================= CUSTOMER ENDPOINTS =======================
 
@@ -757,12 +1184,12 @@ async def get_service_availability(
 async def create_customer(data: CustomerCreate):
     """Crear cliente"""
     # Verificar email único
-    existing = [c for c in customers.values() if c.email == data.email]
+    existing = customers_by_email.get(data.email)
     if existing:
-        return existing[0]
+        return existing
 
-    customer = Customer(**data.model_dump())
-    customers[customer.id] = customer
+    customer = Customer.model_construct(**data.__dict__)
+    save_customer(customer)
     return customer
 
 @app.get("/customers", response_model=List[Customer])
@@ -777,14 +1204,12 @@ async def list_customers(
 
     if search:
         search_lower = search.lower()
-        result = [c for c in result if
-                  search_lower in c.first_name.lower() or
-                  search_lower in c.last_name.lower() or
-                  search_lower in c.email.lower()]
+        # El separador NUL no puede aparecer dentro de un campo
+        result = [] if "\0" in search_lower else [c for c in result if search_lower in customer_search_text[c.id]]
     if is_vip is not None:
         result = [c for c in result if c.is_vip == is_vip]
 
-    return result[skip:skip + limit]
+    return list_response(result[skip:skip + limit])
 
 @app.get("/customers/{customer_id}", response_model=Customer)
 async def get_customer(customer_id: str):
@@ -800,15 +1225,16 @@ async def get_customer_bookings(
     upcoming: bool = False
 ):
     """Obtener reservas de cliente"""
-    result = [b for b in bookings.values() if b.customer_id == customer_id]
+    entries = customer_booking_starts.get(customer_id, [])
+    if upcoming:
+        # Solo las que empiezan después de ahora
+        entries = entries[bisect_right(entries, (datetime.utcnow(), float("inf"))):]
 
+    result = [bookings[booking_id] for _, _, booking_id in reversed(entries)]
     if status:
         result = [b for b in result if b.status == status]
-    if upcoming:
-        now = datetime.utcnow()
-        result = [b for b in result if b.start_datetime > now]
 
-    return sorted(result, key=lambda x: x.start_datetime, reverse=True)
+    return list_response(result)
 
 @app.get("/customers/{customer_id}/history")
 async def get_customer_history(customer_id: str):
@@ -817,17 +1243,16 @@ async def get_customer_history(customer_id: str):
         raise HTTPException(status_code=404, detail="Customer not found")
 
     customer = customers[customer_id]
-    customer_bookings = [b for b in bookings.values() if b.customer_id == customer_id]
 
     return {
         "customer_id": customer_id,
-        "total_bookings": len(customer_bookings),
-        "completed": len([b for b in customer_bookings if b.status == BookingStatus.COMPLETED]),
-        "cancelled": len([b for b in customer_bookings if b.status == BookingStatus.CANCELLED]),
+        "total_bookings": len(bookings_by_customer.get(customer_id, ())),
+        "completed": customer.completed_count,
+        "cancelled": customer.cancelled_count,
         "no_shows": customer.no_shows,
-        "total_spent": sum(b.total for b in customer_bookings if b.status == BookingStatus.COMPLETED),
+        "total_spent": round(customer.total_spent, 2),
         "favorite_services": [],  # Calculate most booked services
-        "last_visit": max((b.start_datetime for b in customer_bookings if b.status == BookingStatus.COMPLETED), default=None)
+        "last_visit": customer.last_visit
     }
 
 # ======================= BOOKING ENDPOINTS =======================
@@ -856,17 +1281,19 @@ async def create_booking(data: BookingCreate):
 
     end_datetime = data.start_datetime + timedelta(minutes=duration)
 
-    # Verificar disponibilidad de recursos
+    # Verificar disponibilidad de recursos. No hay ningún await entre esta comprobación y
+    # save_booking, así que en el event loop ambas son atómicas y no hace falta un lock
     for resource_id in data.resource_ids:
+        if resource_id not in resources:
+            raise HTTPException(status_code=404, detail=f"Resource {resource_id} not found")
         if not check_resource_availability(resource_id, data.start_datetime, end_datetime):
-            raise HTTPException(status_code=400, detail=f"Resource {resource_id} not available")
+            raise HTTPException(status_code=409, detail=f"Resource {resource_id} not available")
 
     # Calcular precio
-    resource = resources.get(data.resource_ids[0]) if data.resource_ids else None
-    pricing = calculate_booking_price(service, resource, duration)
+    pricing = calculate_booking_price(data.service_id, data.resource_ids[0] if data.resource_ids else None, duration)
 
-    # Crear reserva
-    booking = Booking(
+    # Crear reserva (todos los campos ya están validados: se construye sin revalidar)
+    booking = Booking.model_construct(
         booking_number=generate_booking_number(),
         customer_id=data.customer_id,
         service_id=data.service_id,
@@ -886,23 +1313,30 @@ async def create_booking(data: BookingCreate):
         source=data.source,
         created_by=data.created_by,
         status=BookingStatus.CONFIRMED if all(
-            resources.get(r, Resource(id="", name="", type=ResourceType.ROOM, location_id="")).auto_confirm
-            for r in data.resource_ids
+            resources[r].auto_confirm for r in data.resource_ids
         ) else BookingStatus.PENDING
     )
-    bookings[booking.id] = booking
+    save_booking(booking)
 
     # Actualizar contador de cliente
     customer.total_bookings += 1
 
-    # Crear reservas recurrentes
+    # Crear reservas recurrentes en segundo plano; la respuesta no espera a la serie completa
     if data.is_recurring and data.recurrence_type != RecurrenceType.NONE and data.recurrence_end:
-        create_recurring_bookings(booking)
+        task = asyncio.create_task(create_recurring_bookings(booking))
+        background_tasks.add(task)
+        task.add_done_callback(background_task_done)
 
     return booking
 
-def create_recurring_bookings(parent: Booking):
-    """Crear reservas recurrentes"""
+def background_task_done(task: asyncio.Task) -> None:
+    """Suelta la referencia a la tarea y registra su excepción; si no, se perdería en silencio"""
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task failed", task=task.get_name(), exc_info=task.exception())
+
+async def create_recurring_bookings(parent: Booking):
+    """Crear reservas recurrentes, avisando por WebSocket de cada una"""
     if not parent.recurrence_end:
         return
 
@@ -917,6 +1351,10 @@ def create_recurring_bookings(parent: Booking):
     current_date = parent.start_datetime + timedelta(days=days)
 
     while current_date.date() <= parent.recurrence_end:
+        # La serie se detiene si la reserva original se cancela mientras se genera
+        if parent.status not in ACTIVE_BOOKING_STATUSES:
+            break
+
         child_end = current_date + timedelta(minutes=parent.duration_minutes)
 
         # Verificar disponibilidad
@@ -926,7 +1364,7 @@ def create_recurring_bookings(parent: Booking):
         )
 
         if all_available:
-            child = Booking(
+            child = Booking.model_construct(
                 booking_number=generate_booking_number(),
                 customer_id=parent.customer_id,
                 service_id=parent.service_id,
@@ -944,9 +1382,18 @@ def create_recurring_bookings(parent: Booking):
                 status=parent.status,
                 source=parent.source
             )
-            bookings[child.id] = child
+            save_booking(child)
+            await notify_location(parent.location_id, {
+                "type": "booking_created",
+                "booking_id": child.id,
+                "parent_booking_id": parent.id,
+                "start_datetime": child.start_datetime.isoformat()
+            })
 
         current_date += timedelta(days=days)
+        # notify_location no cede el control si no hay clientes conectados; ceder en cada
+        # iteración evita que una serie larga bloquee el resto de peticiones
+        await asyncio.sleep(0)
 
 @app.get("/bookings", response_model=List[Booking])
 async def list_bookings(
@@ -959,21 +1406,26 @@ async def list_bookings(
     limit: int = 50
 ):
     """Listar reservas"""
-    result = list(bookings.values())
+    if resource_id:
+        result = get_bookings_for_resource(resource_id)
+        if start_date:
+            result = [b for b in result if b.start_datetime.date() >= start_date]
+        if end_date:
+            result = [b for b in result if b.start_datetime.date() <= end_date]
+    elif start_date or end_date:
+        result = bookings_between(start_date, end_date)
+    elif location_id:
+        result = [bookings[booking_id] for booking_id in bookings_by_location.get(location_id, ())]
+    else:
+        result = list(bookings.values())
 
     if location_id:
         result = [b for b in result if b.location_id == location_id]
-    if resource_id:
-        result = [b for b in result if resource_id in b.resource_ids]
     if status:
         result = [b for b in result if b.status == status]
-    if start_date:
-        result = [b for b in result if b.start_datetime.date() >= start_date]
-    if end_date:
-        result = [b for b in result if b.start_datetime.date() <= end_date]
 
     result = sorted(result, key=lambda x: x.start_datetime)
-    return result[skip:skip + limit]
+    return list_response(result[skip:skip + limit])
 
 @app.get("/bookings/{booking_id}", response_model=Booking)
 async def get_booking(booking_id: str):
@@ -989,7 +1441,7 @@ async def confirm_booking(booking_id: str):
         raise HTTPException(status_code=404, detail="Booking not found")
 
     booking = bookings[booking_id]
-    booking.status = BookingStatus.CONFIRMED
+    set_booking_status(booking, BookingStatus.CONFIRMED)
     booking.confirmation_sent = True
     booking.updated_at = datetime.utcnow()
 
@@ -1005,11 +1457,13 @@ async def cancel_booking(
     if booking_id not in bookings:
         raise HTTPException(status_code=404, detail="Booking not found")
 
+    # Una sola lectura del reloj para todas las marcas de tiempo de la petición
+    now = datetime.utcnow()
     booking = bookings[booking_id]
-    booking.status = BookingStatus.CANCELLED
-    booking.cancelled_at = datetime.utcnow()
+    set_booking_status(booking, BookingStatus.CANCELLED)
+    booking.cancelled_at = now
     booking.cancellation_reason = reason
-    booking.updated_at = datetime.utcnow()
+    booking.updated_at = now
 
     # Actualizar contador de cliente
     if booking.customer_id in customers:
@@ -1017,10 +1471,11 @@ async def cancel_booking(
 
     # Cancelar recurrentes si aplica
     if cancel_recurring:
-        children = [b for b in bookings.values() if b.parent_booking_id == booking_id]
-        for child in children:
-            child.status = BookingStatus.CANCELLED
-            child.cancelled_at = datetime.utcnow()
+        for child_id in bookings_by_parent.get(booking_id, ()):
+            child = bookings[child_id]
+            set_booking_status(child, BookingStatus.CANCELLED)
+            child.cancelled_at = now
+            child.updated_at = now
 
     # Notificar a waitlist
     check_waitlist_for_slot(booking)
@@ -1041,13 +1496,15 @@ async def reschedule_booking(
     new_end = new_start + timedelta(minutes=booking.duration_minutes)
     resource_ids = new_resource_ids or booking.resource_ids
 
-    # Verificar disponibilidad
+    # Verificar disponibilidad (sin await hasta guardar, igual que en create_booking)
     for resource_id in resource_ids:
+        if resource_id not in resources:
+            raise HTTPException(status_code=404, detail=f"Resource {resource_id} not found")
         if not check_resource_availability(resource_id, new_start, new_end, booking_id):
-            raise HTTPException(status_code=400, detail=f"Resource {resource_id} not available")
+            raise HTTPException(status_code=409, detail=f"Resource {resource_id} not available")
 
     # Crear nueva reserva
-    new_booking = Booking(
+    new_booking = Booking.model_construct(
         booking_number=generate_booking_number(),
         customer_id=booking.customer_id,
         service_id=booking.service_id,
@@ -1065,10 +1522,10 @@ async def reschedule_booking(
         status=BookingStatus.CONFIRMED,
         source=booking.source
     )
-    bookings[new_booking.id] = new_booking
+    save_booking(new_booking)
 
     # Marcar original como reagendada
-    booking.status = BookingStatus.RESCHEDULED
+    set_booking_status(booking, BookingStatus.RESCHEDULED)
     booking.updated_at = datetime.utcnow()
 
     return new_booking
@@ -1080,8 +1537,9 @@ async def check_in_booking(booking_id: str):
         raise HTTPException(status_code=404, detail="Booking not found")
 
     booking = bookings[booking_id]
-    booking.checked_in_at = datetime.utcnow()
-    booking.updated_at = datetime.utcnow()
+    now = datetime.utcnow()
+    booking.checked_in_at = now
+    booking.updated_at = now
 
     return {"message": "Checked in", "time": booking.checked_in_at}
 
@@ -1092,9 +1550,10 @@ async def check_out_booking(booking_id: str):
         raise HTTPException(status_code=404, detail="Booking not found")
 
     booking = bookings[booking_id]
-    booking.checked_out_at = datetime.utcnow()
-    booking.status = BookingStatus.COMPLETED
-    booking.updated_at = datetime.utcnow()
+    now = datetime.utcnow()
+    booking.checked_out_at = now
+    set_booking_status(booking, BookingStatus.COMPLETED)
+    booking.updated_at = now
 
     return {"message": "Checked out", "time": booking.checked_out_at}
 
@@ -1105,7 +1564,7 @@ async def mark_no_show(booking_id: str):
         raise HTTPException(status_code=404, detail="Booking not found")
 
     booking = bookings[booking_id]
-    booking.status = BookingStatus.NO_SHOW
+    set_booking_status(booking, BookingStatus.NO_SHOW)
     booking.updated_at = datetime.utcnow()
 
     # Actualizar contador de cliente
@@ -1128,7 +1587,7 @@ async def add_to_waitlist(
     if customer_id not in customers:
         raise HTTPException(status_code=404, detail="Customer not found")
 
-    entry = WaitlistEntry(
+    entry = WaitlistEntry.model_construct(
         customer_id=customer_id,
         service_id=service_id,
         resource_id=resource_id,
@@ -1137,6 +1596,7 @@ async def add_to_waitlist(
         expires_at=datetime.utcnow() + timedelta(days=30)
     )
     waitlist[entry.id] = entry
+    waiting_entries[entry.id] = entry
 
     return entry
 
@@ -1147,27 +1607,30 @@ async def get_waitlist(
     status: str = "waiting"
 ):
     """Obtener lista de espera"""
-    result = [w for w in waitlist.values() if w.status == status]
+    if status == "waiting":
+        result = list(waiting_entries.values())
+    else:
+        result = [w for w in waitlist.values() if w.status == status]
 
     if service_id:
         result = [w for w in result if w.service_id == service_id]
     if resource_id:
         result = [w for w in result if w.resource_id == resource_id]
 
-    return sorted(result, key=lambda x: x.created_at)
+    return list_response(sorted(result, key=lambda x: x.created_at))
 
 def check_waitlist_for_slot(cancelled_booking: Booking):
     """Verificar waitlist cuando se cancela una reserva"""
     matching_entries = [
-        w for w in waitlist.values()
-        if w.status == "waiting" and
-        (w.service_id == cancelled_booking.service_id or
-         w.resource_id in cancelled_booking.resource_ids)
+        w for w in waiting_entries.values()
+        if w.service_id == cancelled_booking.service_id or
+        w.resource_id in cancelled_booking.resource_ids
     ]
 
     for entry in matching_entries[:3]:  # Notificar a los primeros 3
         entry.status = "offered"
         entry.offered_booking_id = cancelled_booking.id
+        del waiting_entries[entry.id]
 
 # ======================= REVIEW ENDPOINTS =======================
 
@@ -1187,13 +1650,13 @@ async def create_review(
     if booking.status != BookingStatus.COMPLETED:
         raise HTTPException(status_code=400, detail="Can only review completed bookings")
 
-    review = Review(
+    review = Review.model_construct(
         booking_id=booking_id,
         customer_id=booking.customer_id,
         rating=rating,
         comment=comment
     )
-    reviews[review.id] = review
+    save_review(review)
 
     return review
 
@@ -1204,18 +1667,21 @@ async def list_reviews(
     min_rating: Optional[int] = None
 ):
     """Listar reseñas"""
-    result = [r for r in reviews.values() if r.is_public]
-
     if resource_id:
-        booking_ids = [b.id for b in bookings.values() if resource_id in b.resource_ids]
-        result = [r for r in result if r.booking_id in booking_ids]
-    if service_id:
-        booking_ids = [b.id for b in bookings.values() if b.service_id == service_id]
-        result = [r for r in result if r.booking_id in booking_ids]
+        result = [reviews[review_id] for review_id in reviews_by_resource.get(resource_id, ())]
+        if service_id:
+            service_reviews = set(reviews_by_service.get(service_id, ()))
+            result = [r for r in result if r.id in service_reviews]
+    elif service_id:
+        result = [reviews[review_id] for review_id in reviews_by_service.get(service_id, ())]
+    else:
+        result = list(reviews.values())
+
+    result = [r for r in result if r.is_public]
     if min_rating:
         result = [r for r in result if r.rating >= min_rating]
 
-    return sorted(result, key=lambda x: x.created_at, reverse=True)
+    return list_response(sorted(result, key=lambda x: x.created_at, reverse=True))
 
 # ======================= AI FEATURES =======================
 
@@ -1245,31 +1711,35 @@ async def ai_find_optimal_slot(
     suggestions = []
     search_start = preferred_datetime - timedelta(hours=flexibility_hours)
     search_end = preferred_datetime + timedelta(hours=flexibility_hours)
+    duration = timedelta(minutes=service.duration)
+    step = timedelta(minutes=30)
 
     current = search_start
     while current <= search_end and len(suggestions) < 5:
-        for resource in compatible_resources:
-            slot_end = current + timedelta(minutes=service.duration)
-            if check_resource_availability(resource.id, current, slot_end):
-                distance = abs((current - preferred_datetime).total_seconds() / 60)
+        slot_end = current + duration
+        # Cada comprobación es un bisect sobre el índice de intervalos activos del recurso
+        free_resources = [r for r in compatible_resources if check_resource_availability(r.id, current, slot_end)]
+        if free_resources:
+            distance = abs((current - preferred_datetime).total_seconds() / 60)
+            start_iso = current.isoformat()
+            end_iso = slot_end.isoformat()
+            for resource in free_resources:
                 suggestions.append({
                     "resource_id": resource.id,
                     "resource_name": resource.name,
-                    "start": current.isoformat(),
-                    "end": slot_end.isoformat(),
+                    "start": start_iso,
+                    "end": end_iso,
                     "distance_minutes": round(distance),
                     "score": max(0, 100 - distance)  # Higher score = closer to preferred
                 })
 
-        current += timedelta(minutes=30)
-
-    # Ordenar por score
-    suggestions.sort(key=lambda x: x["score"], reverse=True)
+        current += step
 
     return {
         "service_id": service_id,
         "preferred_datetime": preferred_datetime.isoformat(),
-        "suggestions": suggestions[:5],
+        # Las 5 de mayor score (nlargest es estable como sorted(..., reverse=True)[:5])
+        "suggestions": heapq.nlargest(5, suggestions, key=itemgetter("score")),
         "message": f"Encontrados {len(suggestions)} slots disponibles" if suggestions else "No hay disponibilidad en el rango solicitado"
     }
 
@@ -1284,9 +1754,8 @@ async def ai_smart_scheduling(
         raise HTTPException(status_code=404, detail="Customer not found")
 
     customer = customers[customer_id]
-    customer_bookings = [b for b in bookings.values()
-                         if b.customer_id == customer_id and
-                         b.status == BookingStatus.COMPLETED]
+    customer_bookings = [b for b in get_bookings_for_customer(customer_id)
+                         if b.status == BookingStatus.COMPLETED]
 
     # Analizar patrones
     preferred_days = {}
@@ -1306,11 +1775,12 @@ async def ai_smart_scheduling(
     # Sugerir próximos slots
     suggestions = []
     current_date = date.today()
+    now = datetime.utcnow()
 
     for _ in range(14):  # Buscar en próximas 2 semanas
         if current_date.strftime("%A") == best_day:
             suggested_time = datetime.combine(current_date, time(best_hour, 0))
-            if suggested_time > datetime.utcnow():
+            if suggested_time > now:
                 slot = find_optimal_slot(service_id, suggested_time, flexibility_hours=2)
                 if slot:
                     suggestions.append({
@@ -1336,31 +1806,25 @@ async def ai_demand_forecast(
     days_ahead: int = 14
 ):
     """Pronóstico de demanda con IA"""
-    import random
-
-    # Analizar histórico
-    location_bookings = [b for b in bookings.values()
-                         if b.location_id == location_id]
+    current_date = date.today()
+    cache_key = ("forecast", location_id, days_ahead, current_date)
+    cached = analytics_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
     forecast = []
-    current_date = date.today()
+    first_weekday = current_date.weekday()
 
     for i in range(days_ahead):
         target_date = current_date + timedelta(days=i)
-        day_name = target_date.strftime("%A")
+        weekday = (first_weekday + i) % 7
 
-        # Base demand on day of week
-        base_demand = {
-            "Monday": 0.7, "Tuesday": 0.85, "Wednesday": 0.9,
-            "Thursday": 0.85, "Friday": 0.75, "Saturday": 0.6, "Sunday": 0.4
-        }
-
-        demand = base_demand.get(day_name, 0.7)
-        demand += random.uniform(-0.1, 0.1)  # Add variance
+        # Demanda base por día de la semana, con variación
+        demand = BASE_DEMAND[weekday] + random.uniform(-0.1, 0.1)
 
         forecast.append({
             "date": target_date.isoformat(),
-            "day": day_name,
+            "day": WEEKDAYS[weekday].value.capitalize(),
             "expected_demand": round(min(max(demand, 0), 1), 2),
             "expected_bookings": round(demand * 20),  # Assuming 20 max bookings
             "recommendation": "Consider extra staff" if demand > 0.85 else
@@ -1368,19 +1832,19 @@ async def ai_demand_forecast(
                             "Reduced staffing possible"
         })
 
-    return {
+    response = {
         "location_id": location_id,
         "forecast_period": f"{current_date} to {current_date + timedelta(days=days_ahead)}",
         "forecast": forecast,
         "peak_days": [f["date"] for f in forecast if f["expected_demand"] > 0.8],
         "low_days": [f["date"] for f in forecast if f["expected_demand"] < 0.5]
     }
+    analytics_cache[cache_key] = response
+    return response
 
 @app.post("/ai/no-show-prediction")
 async def ai_no_show_prediction(booking_id: Optional[str] = None):
     """Predicción de no-shows"""
-    import random
-
     target_bookings = list(bookings.values())
     if booking_id:
         if booking_id not in bookings:
@@ -1388,36 +1852,43 @@ async def ai_no_show_prediction(booking_id: Optional[str] = None):
         target_bookings = [bookings[booking_id]]
 
     # Filtrar solo pending/confirmed futuros
+    now = datetime.utcnow()
     target_bookings = [b for b in target_bookings
-                       if b.status in [BookingStatus.PENDING, BookingStatus.CONFIRMED] and
-                       b.start_datetime > datetime.utcnow()]
+                       if b.status in ACTIVE_BOOKING_STATUSES and b.start_datetime > now]
+
+    # Los factores del cliente se calculan una vez por cliente, no por reserva
+    customer_factors: Dict[str, Tuple[int, List[str]]] = {}
 
     predictions = []
     for booking in target_bookings:
         customer = customers.get(booking.customer_id)
-        risk_score = 0
-        factors = []
-
-        if customer:
-            # Factor: Historial de no-shows
-            if customer.no_shows > 0:
-                risk_score += min(customer.no_shows * 15, 40)
-                factors.append(f"{customer.no_shows} no-shows previos")
-
-            # Factor: Ratio de cancelaciones
-            if customer.total_bookings > 0:
-                cancel_rate = customer.cancellations / customer.total_bookings
-                if cancel_rate > 0.3:
-                    risk_score += 20
-                    factors.append("Alta tasa de cancelación")
-
-            # Factor: Cliente nuevo
-            if customer.total_bookings <= 1:
-                risk_score += 10
-                factors.append("Cliente nuevo")
+        if booking.customer_id not in customer_factors:
+            customer_risk = 0
+            customer_reasons = []
+            if customer:
+                # Factor: Historial de no-shows
+                if customer.no_shows > 0:
+                    customer_risk += min(customer.no_shows * 15, 40)
+                    customer_reasons.append(f"{customer.no_shows} no-shows previos")
+
+                # Factor: Ratio de cancelaciones
+                if customer.total_bookings > 0:
+                    cancel_rate = customer.cancellations / customer.total_bookings
+                    if cancel_rate > 0.3:
+                        customer_risk += 20
+                        customer_reasons.append("Alta tasa de cancelación")
+
+                # Factor: Cliente nuevo
+                if customer.total_bookings <= 1:
+                    customer_risk += 10
+                    customer_reasons.append("Cliente nuevo")
+            customer_factors[booking.customer_id] = (customer_risk, customer_reasons)
+
+        risk_score, customer_reasons = customer_factors[booking.customer_id]
+        factors = list(customer_reasons)
 
         # Factor: Reserva muy adelantada
-        days_ahead = (booking.start_datetime - datetime.utcnow()).days
+        days_ahead = (booking.start_datetime - now).days
         if days_ahead > 14:
             risk_score += 15
             factors.append("Reserva con mucha anticipación")
@@ -1457,10 +1928,9 @@ async def ai_resource_optimization(
     location_resources = [r for r in resources.values()
                           if r.location_id == location_id and r.is_active]
 
-    day_bookings = [b for b in bookings.values()
+    day_bookings = [b for b in bookings_between(target_date, target_date)
                     if b.location_id == location_id and
-                    b.start_datetime.date() == target_date and
-                    b.status in [BookingStatus.PENDING, BookingStatus.CONFIRMED]]
+                    b.status in ACTIVE_BOOKING_STATUSES]
 
     analysis = []
     for resource in location_resources:
@@ -1498,34 +1968,36 @@ async def ai_booking_insights(
     days: int = 30
 ):
     """Insights de reservas con IA"""
-    cutoff = datetime.utcnow() - timedelta(days=days)
-    recent_bookings = [b for b in bookings.values() if b.created_at >= cutoff]
-
-    # Métricas
-    total = len(recent_bookings)
-    completed = len([b for b in recent_bookings if b.status == BookingStatus.COMPLETED])
-    cancelled = len([b for b in recent_bookings if b.status == BookingStatus.CANCELLED])
-    no_shows = len([b for b in recent_bookings if b.status == BookingStatus.NO_SHOW])
-
-    # Revenue
-    total_revenue = sum(b.total for b in recent_bookings if b.status == BookingStatus.COMPLETED)
-
-    # Por día de semana
-    by_day = {}
-    for b in recent_bookings:
-        day = b.start_datetime.strftime("%A")
-        by_day[day] = by_day.get(day, 0) + 1
+    cache_key = ("insights", days)
+    cached = analytics_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
-    # Por hora
-    by_hour = {}
-    for b in recent_bookings:
-        hour = b.start_datetime.hour
-        by_hour[hour] = by_hour.get(hour, 0) + 1
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    recent_ids = created_booking_ids[bisect_left(booking_created_ats, cutoff):]
+
+    # Métricas, por día de semana y por hora en una sola pasada
+    total = len(recent_ids)
+    by_status = Counter()
+    by_day = Counter()
+    by_hour = Counter()
+    total_revenue = 0
+    for booking_id in recent_ids:
+        b = bookings[booking_id]
+        by_status[b.status] += 1
+        if b.status == BookingStatus.COMPLETED:
+            total_revenue += b.total
+        by_day[b.start_datetime.strftime("%A")] += 1
+        by_hour[b.start_datetime.hour] += 1
+
+    completed = by_status[BookingStatus.COMPLETED]
+    cancelled = by_status[BookingStatus.CANCELLED]
+    no_shows = by_status[BookingStatus.NO_SHOW]
 
     peak_day = max(by_day, key=by_day.get) if by_day else None
     peak_hour = max(by_hour, key=by_hour.get) if by_hour else None
 
-    return {
+    response = {
         "period_days": days,
         "metrics": {
             "total_bookings": total,
@@ -1549,27 +2021,17 @@ async def ai_booking_insights(
             f"Tasa de no-show: {round(no_shows / total * 100, 1)}%" if total > 0 and no_shows > 0 else None
         ]
     }
+    analytics_cache[cache_key] = response
+    return response
 
 # ======================= CALENDAR INTEGRATION =======================
 
-@app.get("/calendar/export/{resource_id}")
-async def export_calendar(
-    resource_id: str,
-    format: str = "ical"
-):
-    """Exportar calendario en formato iCal"""
-    if resource_id not in resources:
-        raise HTTPException(status_code=404, detail="Resource not found")
-
-    resource_bookings = [b for b in bookings.values()
-                         if resource_id in b.resource_ids and
-                         b.status in [BookingStatus.PENDING, BookingStatus.CONFIRMED]]
-
-    # Generar iCal básico
-    ical = "BEGIN:VCALENDAR\nVERSION:2.0\nPRODID:-//AI-Suite//Bookings//EN\n"
+def iter_ical(resource_bookings: List[Booking]) -> Iterator[str]:
+    """Genera un iCal básico trozo a trozo: cabecera, un VEVENT por reserva y cierre"""
+    yield "BEGIN:VCALENDAR\nVERSION:2.0\nPRODID:-//AI-Suite//Bookings//EN\n"
 
     for booking in resource_bookings:
-        ical += f"""BEGIN:VEVENT
+        yield f"""BEGIN:VEVENT
 UID:{booking.id}@ai-suite
 DTSTART:{booking.start_datetime.strftime('%Y%m%dT%H%M%SZ')}
 DTEND:{booking.end_datetime.strftime('%Y%m%dT%H%M%SZ')}
@@ -1578,7 +2040,28 @@ DESCRIPTION:{booking.notes or ''}
 END:VEVENT
 """
 
-    ical += "END:VCALENDAR"
+    yield "END:VCALENDAR"
+
+@app.get("/calendar/export/{resource_id}")
+async def export_calendar(
+    resource_id: str,
+    format: str = "ical"
+):
+    """Exportar calendario en formato iCal (format=ics lo envía como text/calendar en streaming)"""
+    if resource_id not in resources:
+        raise HTTPException(status_code=404, detail="Resource not found")
+
+    resource_bookings = [b for b in get_bookings_for_resource(resource_id)
+                         if b.status in ACTIVE_BOOKING_STATUSES]
+
+    if format == "ics":
+        return StreamingResponse(
+            iter_ical(resource_bookings),
+            media_type="text/calendar",
+            headers={"Content-Disposition": f'attachment; filename="{resource_id}.ics"'}
+        )
+
+    ical = "".join(iter_ical(resource_bookings))
 
     return {
         "resource_id": resource_id,
@@ -1599,9 +2082,8 @@ async def utilization_report(
     start = start_date or date.today() - timedelta(days=30)
     end = end_date or date.today()
 
-    target_bookings = [b for b in bookings.values()
-                       if start <= b.start_datetime.date() <= end and
-                       b.status == BookingStatus.COMPLETED]
+    target_bookings = [b for b in bookings_between(start, end)
+                       if b.status == BookingStatus.COMPLETED]
 
     if location_id:
         target_bookings = [b for b in target_bookings if b.location_id == location_id]
@@ -1642,24 +2124,37 @@ async def utilization_report(
 
 # ======================= WEBSOCKET =======================
 
+async def broadcast_text(location_id: str, payload: str):
+    """Envía un texto a todos los clientes WebSocket de una ubicación en paralelo y retira los que fallan"""
+    connections = active_connections.get(location_id)
+    if not connections:
+        return
+    targets = list(connections)
+    results = await asyncio.gather(*(conn.send_text(payload) for conn in targets), return_exceptions=True)
+    for conn, result in zip(targets, results):
+        if isinstance(result, Exception):
+            connections.discard(conn)
+
+async def notify_location(location_id: str, message: Dict[str, Any]):
+    """Envía un mensaje a los clientes WebSocket conectados a una ubicación, serializado una sola vez"""
+    await broadcast_text(location_id, orjson.dumps(message).decode())
+
 @app.websocket("/ws/{location_id}")
 async def websocket_endpoint(websocket: WebSocket, location_id: str):
     """WebSocket para actualizaciones en tiempo real"""
     await websocket.accept()
-
-    if location_id not in active_connections:
-        active_connections[location_id] = []
-    active_connections[location_id].append(websocket)
+    active_connections.setdefault(location_id, set()).add(websocket)
 
     try:
         while True:
             data = await websocket.receive_text()
-            # Broadcast updates
-            message = json.loads(data)
-            for conn in active_connections.get(location_id, []):
-                await conn.send_json(message)
+            # Broadcast updates: se valida que sea JSON y se reenvía el texto tal cual
+            orjson.loads(data)
+            await broadcast_text(location_id, data)
     except WebSocketDisconnect:
-        active_connections[location_id].remove(websocket)
+        pass
+    finally:
+        active_connections[location_id].discard(websocket)
 
 # ======================= HEALTH CHECK =======================
 
@@ -1682,9 +2177,9 @@ async def get_stats():
         "services": len(services),
         "customers": len(customers),
         "total_bookings": len(bookings),
-        "pending_bookings": len([b for b in bookings.values() if b.status == BookingStatus.PENDING]),
-        "confirmed_bookings": len([b for b in bookings.values() if b.status == BookingStatus.CONFIRMED]),
-        "waitlist_entries": len([w for w in waitlist.values() if w.status == "waiting"]),
+        "pending_bookings": booking_status_counts[BookingStatus.PENDING],
+        "confirmed_bookings": booking_status_counts[BookingStatus.CONFIRMED],
+        "waitlist_entries": len(waiting_entries),
         "reviews": len(reviews)
     }
 